@@ -3,12 +3,19 @@ import socket
 import logging
 import ssl
 from protocol import protocol_send
-from protocol import protocol_receive
+from protocol import FrameReader
 import threading
 import pickle
 import os
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from songs_queue import SongsQueue
 from player import MusicPlayer
+from download import Download
+from connection_pool import ConnectionPool
+from song_cache import SongCache
+from prefetch import Prefetcher
 
 
 CACHE_FOLDER = r"C:\work\cyber\FinalProject\code.CLIENT\cache"
@@ -16,6 +23,8 @@ LOG_DIR = 'log'
 LOG_FILE_CLIENT = os.path.join(LOG_DIR, 'client.log')
 LOG_FILE_PLAYER = os.path.join(LOG_DIR, 'player.log')
 LOG_FORMAT = '%(levelname)s | %(asctime)s | %(name)s | %(message)s'
+PREBUFFER_BYTES = 256 * 1024  # progressive playback starts once this much of the song is downloaded
+PLAYLIST_WORKERS = 4  # songs of a playlist downloaded at the same time when progressive playback is off
 
 
 class Client:
@@ -43,9 +52,23 @@ class Client:
             temp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.main_socket = self.create_ssl_socket(temp_socket, ip)
             self.main_socket.connect(self.MAIN_SERVER_ADDR)
+            self.main_reader = FrameReader(self.main_socket)
+            self.media_pool = ConnectionPool(self.context)  # keep-alive connections to the media servers
+            self.request_ids = itertools.count(1)
 
             self.q = SongsQueue()
             self.p = MusicPlayer()
+            self.cache = SongCache(CACHE_FOLDER)
+            self.progressive = True  # play songs while they download
+            self.prebuffer = PREBUFFER_BYTES
+            self.downloads = {}  # cache path -> Download, for songs still downloading
+            self.downloads_lock = threading.Lock()  # guards downloads and song_locks
+            self.song_locks = {}  # song id -> Lock held while the song's .part file is written
+            self.first_audio_times = []  # time-to-first-audio of every progressive song, in seconds
+            self.playlist_workers = PLAYLIST_WORKERS
+            self.prefetcher = Prefetcher(self, songs=self.playlist_workers)
+            self.playlist_generation = 0  # counts setup_playlist calls, so an old playlist stops queueing
+            self.playlist_lock = threading.Lock()  # held while the queue is replaced, or read to queue or claim songs
             self.client_to_gui_queue = queue.Queue()
             self.gui_to_client_queue = queue.Queue()
 
@@ -155,7 +178,7 @@ class Client:
                 data = [username, password]
                 protocol_send(self.main_socket, cmd, data)
                 self.logging_protocol("send", cmd, data)
-                cmd, data = protocol_receive(self.main_socket)
+                cmd, data = self.main_reader.receive()
                 self.logging_protocol("received", cmd, data)
                 if data[0] == "T":
                     self.username = username
@@ -168,7 +191,7 @@ class Client:
                 data = [username, password]
                 protocol_send(self.main_socket, cmd, data)
                 self.logging_protocol("send", cmd, data)
-                cmd, data = protocol_receive(self.main_socket)
+                cmd, data = self.main_reader.receive()
                 self.logging_protocol("received", cmd, data)
                 if data[0] == "T":
                     self.username = username
@@ -185,6 +208,7 @@ class Client:
                 if not self.player_thread.is_alive():
                     print("pt2")
                     self.player_thread.start()
+                    self.prefetcher.start()
 
         except (ConnectionError, OSError) as net_err:
             self.client_log.debug(f"[ERROR] Network error: {net_err}")
@@ -199,43 +223,87 @@ class Client:
         finally:
             return data
 
-    def listen_song(self, song_id):
+    def listen_song(self, song_id, address=None):
         """
-        Attempts to play a song by ID. If the song exists locally, it is added to the playback queue.
+        Attempts to play a song by ID. If the song is in the cache, it is added to the playback queue.
         Otherwise, it fetches the media server address, downloads the song, and adds it to the queue.
+        In progressive mode the song is queued right away; the prefetcher downloads it in the
+        background when it is among the next songs, or the player when it is its turn,
+        and the player starts it once the prebuffer is downloaded.
         :param song_id: The ID of the song to listen to.
+        :param address: Optional "gad" reply that was already received for this song.
         """
         try:
-            file_path = os.path.join(f"{song_id}.mp3")
-            if os.path.exists(file_path):
+            file_path = self.cache.lookup(song_id)
+            if file_path:
                 self.q.add_to_queue(file_path)
-                self.client_log.debug(f"{file_path} was added to queue (local file)")
+                self.client_log.debug(f"{file_path} was added to queue (cached)")
                 return
 
             # Request address of the media server hosting the song
-            data = self.get_address(song_id)
+            data = address if address is not None else self.get_address(song_id)
             if data[0] == "T":
-                ip = data[1]
-                port = int(data[2])
-                media_server_address = (ip, port)
+                media_server_addresses = self.reply_addresses(data)
+
+                if self.progressive:
+                    path = self.cache.path(song_id)
+                    with self.downloads_lock:
+                        # a song queued twice shares one download, so only one thread appends to its .part file
+                        download = self.downloads.get(path)
+                        if download is None or download.failed:
+                            download = Download(path, song_id, media_server_addresses)
+                            self.downloads[path] = download
+                    self.q.add_to_queue(download.path)
+                    self.prefetcher.wake()
+                    self.client_log.debug(f"{download.path} was added to queue (to download)")
+                    return
 
                 # Attempt to get the song from the media server
-                file_name = self.get_song(song_id, media_server_address)
+                file_name = self.get_song(song_id, media_server_addresses)
                 if file_name != "error":
                     self.q.add_to_queue(file_name)
                     self.client_log.debug(f"{file_name} was added to queue (downloaded)")
                 else:
-                    self.client_log.error(f"Failed to download song {song_id} from {media_server_address}")
+                    self.client_log.error(f"Failed to download song {song_id} from {media_server_addresses}")
             else:
                 self.client_log.error(f"Could not get address for song {song_id}: {data}")
         except Exception as e:
             self.client_log.error(f"Unexpected error in listen_song: {e}")
 
+    def download_song(self, download):
+        """
+        Runs on a prefetch worker or its own thread: downloads a queued song for progressive playback.
+        :param download: Download of the song, claimed by the caller, where the progress is reported
+        """
+        if self.get_song(download.song_id, download.server_addresses, download) == "error":
+            self.client_log.error(f"Failed to download song {download.song_id} from {download.server_addresses}")
+        with self.downloads_lock:
+            if self.downloads.get(download.path) is download:
+                del self.downloads[download.path]
+
+    def song_lock(self, song_id):
+        """
+        :param song_id: ID of the song
+        :return: threading.Lock, held by the thread that downloads the song into its .part file
+        """
+        with self.downloads_lock:
+            return self.song_locks.setdefault(str(song_id), threading.Lock())
+
+    @staticmethod
+    def reply_addresses(data):
+        """
+        :param data: list, a successful "gad" style reply: ["T", ip, port] followed by the (ip, port)
+                     of the song's other replicas, if the main server sent them
+        :return: list of tuple(str, int), the media servers holding the song, in the order to try them
+        """
+        return [(data[i], int(data[i + 1])) for i in range(1, len(data) - 1, 2)]
+
     def get_address(self, song_id):
         """
         Requests the media server address hosting the specified song from the main server.
         :param song_id: int, the ID of the requested song
-        :return: tuple, server response like ("T", ip, port) on success or ("F", error_message) on failure
+        :return: tuple, server response like ("T", ip, port, ...) on success or ("F", error_message) on failure;
+                 the main server may add the song's other replicas after the first one (see reply_addresses)
         """
         try:
             cmd = "gad"
@@ -243,7 +311,7 @@ class Client:
             protocol_send(self.main_socket, cmd, data)
             self.logging_protocol("send", cmd, data)
 
-            cmd, data = protocol_receive(self.main_socket)
+            cmd, data = self.main_reader.receive()
             self.logging_protocol("received", cmd, data)
 
             if data[0] == "F":
@@ -255,43 +323,174 @@ class Client:
             self.client_log.error(f"Error in get_address for song_id {song_id}: {e}")
             return ["F", f"Exception occurred: {str(e)}"]
 
-    def get_song(self, song_id, server_address):
+    def pipeline_requests(self, requests):
+        """
+        Sends several requests to the main server back to back, each with its own request ID,
+        and then collects the replies, which may arrive in any order.
+        :param requests: list of (cmd, data) tuples
+        :return: list, the reply data of every request, in request order
+        """
+        pending = {}
+        for cmd, data in requests:
+            request_id = next(self.request_ids) % 0xFFFFFFFF + 1
+            protocol_send(self.main_socket, cmd, data, request_id=request_id)
+            self.logging_protocol("send", cmd, data)
+            pending[request_id] = len(pending)
+
+        replies = [["F", "no reply"]] * len(pending)
+        while pending:
+            cmd, data = self.main_reader.receive()
+            self.logging_protocol("received", cmd, data)
+            if cmd == "error":
+                break
+            index = pending.pop(self.main_reader.request_id, None)
+            if index is not None:
+                replies[index] = data
+        return replies
+
+    def get_addresses(self, song_ids):
+        """
+        Requests the media server addresses of several songs in one round trip.
+        Uses the batch "gab" command, and falls back to pipelined "gad" requests
+        if the main server does not know it.
+        :param song_ids: list, IDs of the requested songs
+        :return: list, a "gad" style reply per song: ["T", ip, port, ip2, port2, ...] or ["F", error_message]
         """
-        Downloads the song file from the media server and saves it locally.
+        try:
+            cmd = "gab"
+            data = [self.token, *song_ids]
+            protocol_send(self.main_socket, cmd, data)
+            self.logging_protocol("send", cmd, data)
+
+            cmd, data = self.main_reader.receive()
+            self.logging_protocol("received", cmd, data)
+
+            if data[0] == "T":
+                addresses = pickle.loads(data[1])
+                replies = []
+                for song_id in song_ids:
+                    ranked = addresses.get(int(song_id))
+                    if not ranked:
+                        replies.append(["F", "ID not found"])
+                        continue
+                    if isinstance(ranked[0], str):
+                        ranked = [ranked]  # a main server that sends only the chosen (ip, port)
+                    replies.append(["T", *[item for address in ranked for item in address]])
+                return replies
+
+            if len(data) > 1 and data[1] in ("Token has expired", "Invalid token"):
+                self.is_expired = True
+                return [data] * len(song_ids)
+
+            replies = self.pipeline_requests([("gad", [self.token, song_id]) for song_id in song_ids])
+            for data in replies:
+                if data[0] == "F" and data[1] in ("Token has expired", "Invalid token"):
+                    self.is_expired = True
+            return replies
+
+        except Exception as e:
+            self.client_log.error(f"Error in get_addresses: {e}")
+            return [["F", f"Exception occurred: {str(e)}"]] * len(song_ids)
+
+    def get_song(self, song_id, server_addresses, download=None):
+        """
+        Downloads the song file from the media server and saves it in the cache.
+        The song is written to a .part file first; if an earlier download of it broke off,
+        only the missing bytes are requested (ranged get) and appended to that file.
+        If a server fails or is busy, the song's next replica is tried, resuming where the first one stopped.
+        The complete song is checked against the server's SHA-256, if the server sent one, before it is cached.
         :param song_id: int, the ID of the requested song
-        :param server_address: tuple(str, int), IP and port of the media server
+        :param server_addresses: list of tuple(str, int), IP and port of the media servers holding the song,
+                                 tried in order
+        :param download: Download, optional, reports the progress so the song can be played while it downloads
         :return: str, filename if downloaded successfully or "error" if failed
         """
         file_path = "error"
         try:
-            media_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            media_server_ip = server_address[0]
-            ssl_media_socket = self.create_ssl_socket(media_socket, media_server_ip)
-            ssl_media_socket.connect(server_address)
-            self.client_log.debug(f"Connection with media server {server_address} successful!")
+            for server_address in server_addresses:
+                file_path, failover = self.get_song_from(song_id, server_address, download)
+                if file_path != "error" or not failover:
+                    break
+                self.client_log.debug(f"Song {song_id} failed on {server_address}, trying the next replica")
+        finally:
+            if download and not download.done:
+                download.fail()
+        return file_path
 
-            cmd = "get"
-            data = [self.token, song_id]
-            protocol_send(ssl_media_socket, cmd, data)
-            self.logging_protocol("send", cmd, data)
+    def get_song_from(self, song_id, server_address, download=None):
+        """
+        One download attempt of get_song, from a single media server.
+        Holds the song's lock, so two downloads of the same song never append to its .part file together;
+        if another thread finished the song meanwhile, the cached file is used.
+        :param song_id: int, the ID of the requested song
+        :param server_address: tuple(str, int), IP and port of the media server
+        :param download: Download, optional, reports the progress
+        :return: tuple, (filename or "error", True if another replica may still succeed)
+        """
+        with self.song_lock(song_id):
+            cached = self.cache.lookup(song_id)
+            if cached:
+                if download:
+                    size = os.path.getsize(cached)
+                    download.start(size, size)
+                    download.finish()
+                return cached, False
+            return self.download_part(song_id, server_address, download)
+
+    def download_part(self, song_id, server_address, download=None):
+        """
+        Body of get_song_from, called with the song's lock held.
+        :param song_id: int, the ID of the requested song
+        :param server_address: tuple(str, int), IP and port of the media server
+        :param download: Download, optional, reports the progress
+        :return: tuple, (filename or "error", True if another replica may still succeed)
+        """
+        file_path = "error"
+        failover = True
+        path = self.cache.path(song_id)
+        part_path = path + ".part"
+        conn = None
+        try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
 
-            cmd, data = protocol_receive(ssl_media_socket)
+            cmd = "rng"
+            data = [self.token, song_id, offset, 0]  # length 0 = up to the end of the song
+            self.logging_protocol("send", cmd, data)
+            # the song itself stays on the socket and is written to disk as it arrives
+            conn, cmd, data = self.media_pool.request(server_address, cmd, data, stream=True)
             self.logging_protocol("received", cmd, data)
-            ssl_media_socket.close()
 
             if data[0] == "F":
                 if data[1] in ("Token has expired", "Invalid token"):
                     self.is_expired = True
-                self.client_log.warning(f"Failed to get song: {data[1]}")
+                    failover = False
+                elif data[1] == "invalid range":
+                    # the partial file does not fit the song on the server, start over next time
+                    os.remove(part_path)
+                self.client_log.warning(f"Failed to get song {song_id}: {data[1]}")
             else:
-                file_name = data[1]
-                if file_name != "file not found":
-                    file_path = os.path.join(CACHE_FOLDER, file_name)
-                    with open(file_path, 'wb') as file:
-                        file.write(data[2])
-                    self.client_log.debug(f"File saved as {file_name}")
+                file_name, total, checksum = data[1], int(data[2]), data[4]
+                progress = None
+                if download:
+                    download.start(total, offset)
+                    progress = download.advance
+                with open(part_path, 'ab') as file:
+                    data[5].write_to(file, progress=progress)
+                if os.path.getsize(part_path) == total:
+                    failover = False
+                    if download:
+                        download.finish()
+                    else:
+                        os.replace(part_path, path)
+                    if self.cache.add(song_id, checksum):
+                        file_path = path
+                        self.client_log.debug(f"File saved as {file_name} (resumed at byte {offset})")
+                    else:
+                        self.client_log.warning(f"Song {song_id} does not match the server checksum, deleted")
                 else:
-                    self.client_log.warning(f"Song with ID {song_id} not found on media server.")
+                    self.client_log.warning(f"Download of song {song_id} incomplete, kept for resume")
+            self.media_pool.release(conn)
+            conn = None
 
         except socket.error as e:
             self.client_log.error(f"Socket error while connecting to media server {server_address}: {e}")
@@ -300,7 +499,9 @@ class Client:
             self.client_log.error(f"Unexpected error in get_song: {e}")
 
         finally:
-            return file_path
+            if conn:
+                conn.close()
+        return file_path, failover
 
     def upload_song(self, song_name, artist, file_path):
         """
@@ -354,7 +555,7 @@ class Client:
             protocol_send(self.main_socket, cmd, data)
             self.logging_protocol("send", cmd, data)
 
-            cmd, data = protocol_receive(self.main_socket)  # e.g., "pad", ["T", id, ip, port]
+            cmd, data = self.main_reader.receive()  # e.g., "pad", ["T", id, ip, port]
             self.logging_protocol("received", cmd, data)
             return data
 
@@ -373,13 +574,6 @@ class Client:
         """
         result = ["F", "error"]
         try:
-            # Try connecting to media server
-            media_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            media_server_ip = server_address[0]
-            ssl_media_socket = self.create_ssl_socket(media_socket, media_server_ip)
-            ssl_media_socket.connect(server_address)
-            self.client_log.debug("Connection with media server successful!")
-
             # Try reading the song file
             try:
                 with open(file_path, "rb") as file:
@@ -389,14 +583,11 @@ class Client:
                 self.client_log.error(f"Failed to read song file: {file_err}")
                 return ["F", "file read error"]
 
-            # Send upload command
+            # Send upload command and receive the response on a pooled connection
             cmd = "pst"
             data = [self.token, song_id, song_bytes]
-            protocol_send(ssl_media_socket, cmd, data)
             self.logging_protocol("send", cmd, data)
-
-            # Receive response
-            cmd, data = protocol_receive(ssl_media_socket)
+            conn, cmd, data = self.media_pool.request(server_address, cmd, data)
             self.logging_protocol("received", cmd, data)
             result = data
 
@@ -404,7 +595,10 @@ class Client:
             if data[0] == "F" and data[1] in ("Token has expired", "Invalid token"):
                 self.is_expired = True
 
-            ssl_media_socket.close()
+            if cmd == "error":
+                conn.close()
+            else:
+                self.media_pool.release(conn)
 
         except socket.error as e:
             self.client_log.error(f"Connection to media server failed: {e}")
@@ -429,7 +623,7 @@ class Client:
             protocol_send(self.main_socket, cmd, data)
             self.logging_protocol("send", cmd, data)
 
-            cmd, data = protocol_receive(self.main_socket)
+            cmd, data = self.main_reader.receive()
             self.logging_protocol("received", cmd, data)
 
             if data[0] == "T":
@@ -474,7 +668,7 @@ class Client:
             protocol_send(self.main_socket, cmd, data)
             self.logging_protocol("send", cmd, data)
 
-            cmd, data = protocol_receive(self.main_socket)
+            cmd, data = self.main_reader.receive()
             self.logging_protocol("received", cmd, data)
 
             if data[0] == "F":
@@ -539,6 +733,7 @@ class Client:
         """
         self.client_log.debug("exit() called - shutting down client")
         try:
+            self.cache.flush()  # keeps the play order of this run for the next one
             # Attempt to send exit command to server
             cmd = "ext"
             data = [self.token]
@@ -553,10 +748,22 @@ class Client:
                     self.client_log.debug("Main socket closed.")
                 except Exception as e:
                     self.client_log.debug(f"Error closing socket: {e}")
+            self.media_pool.close_all()
 
             # Reset components and state
             self.q = SongsQueue()
             self.p = MusicPlayer()
+            self.cache = SongCache(CACHE_FOLDER)
+            self.progressive = True  # play songs while they download
+            self.prebuffer = PREBUFFER_BYTES
+            self.downloads = {}  # cache path -> Download, for songs still downloading
+            self.downloads_lock = threading.Lock()  # guards downloads and song_locks
+            self.song_locks = {}  # song id -> Lock held while the song's .part file is written
+            self.first_audio_times = []  # time-to-first-audio of every progressive song, in seconds
+            self.playlist_workers = PLAYLIST_WORKERS
+            self.prefetcher = Prefetcher(self, songs=self.playlist_workers)
+            self.playlist_generation = 0  # counts setup_playlist calls, so an old playlist stops queueing
+            self.playlist_lock = threading.Lock()  # held while the queue is replaced, or read to queue or claim songs
             self.client_to_gui_queue = queue.Queue()
             self.gui_to_client_queue = queue.Queue()
 
@@ -576,18 +783,37 @@ class Client:
     def setup_playlist(self, playlist):
         """
         Clears the current queue and starts playing the given playlist.
+        The first song is queued right away; the addresses of the others that are not cached are resolved in one
+        batch request. In progressive mode they are queued at once and the prefetcher downloads
+        them; otherwise they are downloaded in the background by playlist_workers threads
+        and queued in playlist order.
 
         :param playlist: list - list of songs (paths or objects) to play
         :return: None
         """
         try:
             self.client_log.debug("Starting playlist playback.")
-            self.q.clear_queue()
+            with self.playlist_lock:
+                self.q.clear_queue()
+                self.playlist_generation += 1
+                generation = self.playlist_generation
             self.client_log.debug("Cleared current queue.")
+            if not playlist:
+                return
 
-            for song in playlist:
-                self.listen_song(song)
-                self.client_log.debug(f"Added song to queue: {song}")
+            self.listen_song(playlist[0])
+            rest = playlist[1:]
+            # only the songs missing from the cache need an address; a cached song gets None
+            missing = [song for song in rest if self.cache.lookup(song) is None]
+            resolved = dict(zip(missing, self.get_addresses(missing))) if missing else {}
+            addresses = [resolved.get(song) for song in rest]
+            if self.progressive:
+                for song, address in zip(rest, addresses):
+                    self.listen_song(song, address)
+                    self.client_log.debug(f"Added song to queue: {song}")
+            else:
+                threading.Thread(target=self.download_playlist, args=(rest, addresses, generation),
+                                 daemon=True).start()
 
             self.client_log.debug("Playlist setup completed.")
 
@@ -595,6 +821,51 @@ class Client:
             self.client_log.debug(f"Error in play_playlist: {e}")
             print(f"Failed to play playlist: {e}")
 
+    def download_playlist(self, songs, addresses, generation):
+        """
+        Runs on its own thread: downloads playlist songs concurrently and queues them in playlist order,
+        each one as soon as it and all songs before it are ready.
+
+        :param songs: list - song IDs in playlist order
+        :param addresses: list - "gad" style reply per song
+        :param generation: int - playlist_generation of the playlist; queueing stops once it changes
+        :return: None
+        """
+        with ThreadPoolExecutor(max_workers=self.playlist_workers) as pool:
+            downloads = [pool.submit(self.fetch_song, song, address) for song, address in zip(songs, addresses)]
+            for song, download in zip(songs, downloads):
+                file_path = download.result()
+                with self.playlist_lock:
+                    # checked under the lock setup_playlist replaces the queue with, so no song of
+                    # this playlist is queued after the queue was cleared for the next one
+                    replaced = generation != self.playlist_generation
+                    if file_path and not replaced:
+                        self.q.add_to_queue(file_path)
+                if replaced:
+                    self.client_log.debug("Playlist replaced, stop queueing")
+                    for rest in downloads:
+                        rest.cancel()
+                    return
+                if file_path:
+                    self.client_log.debug(f"Added song to queue: {song}")
+
+    def fetch_song(self, song_id, address):
+        """
+        Returns the cached song, downloading it first if needed.
+
+        :param song_id: ID of the song
+        :param address: "gad" style reply for the song, or None if the song was cached when the playlist started
+        :return: str - path of the song, or None if it could not be downloaded
+        """
+        file_path = self.cache.lookup(song_id)
+        if file_path:
+            return file_path
+        if address is None or address[0] != "T":
+            self.client_log.error(f"Could not get address for song {song_id}: {address}")
+            return None
+        file_path = self.get_song(song_id, self.reply_addresses(address))
+        return None if file_path == "error" else file_path
+
     def player_func(self):
         """
         Main player thread loop that processes commands from the GUI queue.
@@ -639,7 +910,7 @@ class Client:
 
             elif cmd == "shutdown":
                 self.p.shutdown()
-                self.delete_files()
+                self.q.clear_queue()  # the played songs stay in the cache for later
                 self.player_log.debug("shut down: ")
                 break
 
@@ -665,7 +936,10 @@ class Client:
             if not self.q.my_queue.empty() or (cmd == "prev" and self.q.prev_song_path != ""):
                 song_path = self.q.get_song(cmd)
                 self.queue_logging()
-                if os.path.exists(song_path):
+                download = self.downloads.get(song_path)
+                if download and not download.done:
+                    self.play_progressive(download)
+                elif os.path.exists(song_path):
                     self.p.play_song(song_path, self.gui_to_client_queue)  # ניגון השיר מופסק במידה שהגיע פקודה חדשה בתור
                 else:
                     self.player_log.debug("song not found")
@@ -677,6 +951,31 @@ class Client:
         self.player_log.debug(self.q.my_queue.empty())
         self.player_log.debug("play loop has finished")
 
+    def play_progressive(self, download):
+        """
+        Plays a song that is still downloading: waits for the prebuffer, then plays it
+        from the growing file, whose reads wait for the download when playback catches up.
+        Logs the time from asking for the song to the start of playback.
+
+        :param download: Download of the song
+        :return: None
+        """
+        if download.claim():
+            threading.Thread(target=self.download_song, args=(download,), daemon=True).start()
+        else:
+            download.throttle = None  # prefetched so far; now it is playing and gets the full bandwidth
+
+        while not download.wait_for(self.prebuffer, timeout=0.1):
+            if download.failed or not self.gui_to_client_queue.empty():
+                self.player_log.debug(f"song not played: {download.path}")
+                return
+
+        first_audio = time.perf_counter() - download.requested
+        self.first_audio_times.append(first_audio)
+        self.player_log.debug(f"time to first audio: {first_audio * 1000:.0f} ms ({download.path})")
+        # the mixer keeps reading the stream while paused, so it is left open (it holds no open file)
+        self.p.play_song(download.path, self.gui_to_client_queue, download.open())
+
     def queue_logging(self):
         """
         Logs the current state of the song queue and player pause status.
@@ -689,25 +988,3 @@ class Client:
 
         msg = f"paused: {self.p.is_paused}::::: recent: {self.q.recent_song_path}, previous: {self.q.prev_song_path}, old: {self.q.old_song_path}, queue: {msg_queue}"
         self.player_log.debug(msg)
-
-    def delete_files(self):
-        """
-        Deletes temporary or old song files stored in the queue and other tracked paths.
-        Checks if each file exists before attempting removal.
-        """
-        try:
-            self.player_log.debug("deleting files")
-            while not self.q.my_queue.empty():
-                file_path = self.q.my_queue.get()
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-
-            if os.path.exists(self.q.old_song_path):
-                os.remove(self.q.old_song_path)
-            if os.path.exists(self.q.prev_song_path):
-                os.remove(self.q.prev_song_path)
-            if os.path.exists(self.q.recent_song_path):
-                print(self.q.recent_song_path)
-                os.remove(self.q.recent_song_path)
-        except Exception as e:
-            self.player_log.error(f"Error deleting files: {e}")
\ No newline at end of file
@@ -0,0 +1,167 @@
+import io
+import os
+import threading
+import time
+
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class Download:
+    """
+    A song being downloaded into the cache folder. The download thread reports its progress here,
+    and the player can wait for a prebuffer and read the song while the rest is still arriving.
+    """
+    def __init__(self, path, song_id=None, server_addresses=None):
+        """
+        :param path: str, final path of the song in the cache folder; it is written to path + ".part"
+        :param song_id: int, optional, ID of the song
+        :param server_addresses: list of tuple(str, int), optional, media servers to download the song from,
+                                 tried in order
+        """
+        self.path = path
+        self.part_path = path + ".part"
+        self.song_id = song_id
+        self.server_addresses = server_addresses
+        self.claimed = False  # a thread has started (or is about to start) the download
+        self.throttle = None  # TokenBucket limiting the download while it is only prefetched
+        self.requested = time.perf_counter()  # when the song was asked for, for time-to-first-audio
+        self.total = None  # song size in bytes, known once the server answered
+        self.written = 0  # bytes in the part file
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+
+    def claim(self, throttle=None):
+        """
+        Lets exactly one thread take the download over.
+        :param throttle: TokenBucket, optional, bandwidth budget for the download
+        :return: bool, True for the first caller, who must run the download
+        """
+        with self.cond:
+            if self.claimed:
+                return False
+            self.claimed = True
+            self.throttle = throttle
+            return True
+
+    def start(self, total, offset):
+        """
+        Called when the server answered: the part file already holds offset bytes of total.
+        :param total: int, song size in bytes
+        :param offset: int, bytes already in the part file
+        """
+        with self.cond:
+            self.total = total
+            self.written = offset
+            self.cond.notify_all()
+
+    def advance(self, count):
+        """
+        Called after count more bytes were flushed to the part file.
+        While the download is throttled this waits for the bandwidth budget,
+        which slows down reading from the socket.
+        :param count: int, number of new bytes
+        """
+        with self.cond:
+            self.written += count
+            self.cond.notify_all()
+        throttle = self.throttle
+        if throttle:
+            throttle.consume(count)
+
+    def finish(self):
+        """
+        Moves the complete part file to its final path and wakes up the readers.
+        The rename is done under the lock, so a reader never opens a path that is being renamed.
+        If there is no part file, the song was already completed by another download.
+        """
+        with self.cond:
+            if os.path.exists(self.part_path) or not os.path.exists(self.path):
+                os.replace(self.part_path, self.path)
+            self.done = True
+            self.cond.notify_all()
+
+    def fail(self):
+        """
+        Marks the download as failed and wakes up the readers.
+        """
+        with self.cond:
+            self.failed = True
+            self.cond.notify_all()
+
+    def wait_for(self, count, timeout=None):
+        """
+        Waits until count bytes are downloaded (or the whole song, if it is shorter).
+        :param count: int, number of bytes to wait for
+        :param timeout: float, optional, seconds to wait at most
+        :return: bool, True if the bytes are there, False on failure or timeout
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.failed or self.done or self.written >= count, timeout)
+            return not self.failed and (self.done or self.written >= count)
+
+    def open(self):
+        """
+        :return: a buffered binary file object that reads the song as it is downloaded
+        """
+        return io.BufferedReader(GrowingFile(self), READ_BUFFER_SIZE)
+
+
+class GrowingFile(io.RawIOBase):
+    """
+    Reads a song that is still being downloaded. A read past the downloaded bytes waits
+    for the download instead of ending the file, so playback never overtakes the download.
+    """
+    def __init__(self, download):
+        """
+        :param download: Download, the download to read
+        """
+        super().__init__()
+        self.download = download
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Moves the read position. Seeking from the end uses the song size announced by the server.
+        """
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            with self.download.cond:
+                self.download.cond.wait_for(lambda: self.download.total is not None or self.download.failed)
+                if self.download.failed:
+                    raise OSError("download failed")
+                offset += self.download.total
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        """
+        Reads the next downloaded bytes into buffer, waiting for them if necessary.
+        :param buffer: writable bytes-like object
+        :return: int, number of bytes read, 0 at the end of the song
+        """
+        download = self.download
+        with download.cond:
+            download.cond.wait_for(lambda: download.failed or download.done or download.written > self.position)
+            if download.failed:
+                raise OSError("download failed")
+            available = download.written - self.position
+            if available <= 0:
+                return 0
+            path = download.path if download.done else download.part_path
+            view = memoryview(buffer).cast("B")
+            with open(path, "rb") as file:
+                file.seek(self.position)
+                count = file.readinto(view[:min(len(view), available)])
+        self.position += count
+        return count
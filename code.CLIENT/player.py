@@ -31,15 +31,19 @@ class MusicPlayer:
         except Exception as e:
             print(f"Failed to setup logging: {e}")
 
-    def play_song(self, file_path, cmd_queue):
+    def play_song(self, file_path, cmd_queue, stream=None):
         """
         Plays the specified song from the beginning.
 
         :param file_path: Path to the audio file to be played.
         :param cmd_queue: A queue to check for incoming commands (e.g., stop or change song).
+        :param stream: Optional binary file object to play instead of the file, e.g. a song still downloading.
         """
         try:
-            pygame.mixer.music.load(file_path)
+            if stream is not None:
+                pygame.mixer.music.load(stream, "mp3")
+            else:
+                pygame.mixer.music.load(file_path)
             pygame.mixer.music.play()
             self.current_file = file_path
             self.is_playing = True
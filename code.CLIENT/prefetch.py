@@ -0,0 +1,103 @@
+import threading
+import time
+
+PREFETCH_SONGS = 3  # songs ahead in the queue that are downloaded in the background
+PREFETCH_RATE = 512 * 1024  # bytes per second shared by all background downloads
+PREFETCH_POLL = 0.5  # seconds between looks at the queue when nothing wakes the prefetcher
+
+
+class TokenBucket:
+    """
+    A bandwidth budget: rate bytes per second, with bursts of up to burst bytes.
+    Threads that use more than the budget wait in consume until it refills.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: int, bytes per second
+        :param burst: int, optional, bucket size in bytes (default is one second of rate)
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        """
+        Takes count bytes from the budget, waiting while it is in debt.
+        :param count: int, number of bytes
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Prefetcher:
+    """
+    Downloads the next songs of the play queue in the background, on a few worker threads
+    and within a shared bandwidth budget, so the song that is playing keeps its bandwidth
+    and skipping to the next song does not wait for a download.
+    """
+    def __init__(self, client, songs=PREFETCH_SONGS, rate=PREFETCH_RATE):
+        """
+        :param client: Client, whose queue and downloads are watched
+        :param songs: int, how many songs ahead are prefetched (one worker thread each),
+                      the client's playlist_workers
+        :param rate: int, bandwidth budget of all prefetch downloads in bytes per second
+        """
+        self.client = client
+        self.songs = songs
+        self.throttle = TokenBucket(rate)
+        self.wake_up = threading.Condition()
+        self.started = False
+
+    def start(self):
+        """
+        Starts the worker threads (once).
+        """
+        if self.started:
+            return
+        self.started = True
+        for _ in range(self.songs):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def wake(self):
+        """
+        Tells the workers that the queue changed.
+        """
+        with self.wake_up:
+            self.wake_up.notify_all()
+
+    def next_download(self):
+        """
+        :return: Download of the first song among the next ones in the queue that nobody downloads yet,
+                 claimed for the caller, or None. A song whose .part file is being written by another
+                 download (e.g. a playlist download) is skipped, so a worker does not wait on its lock.
+                 The queue is read under the client's playlist_lock, so a song of a playlist that
+                 was just replaced is not claimed.
+        """
+        with self.client.playlist_lock:
+            for path in self.client.q.peek(self.songs):
+                download = self.client.downloads.get(path)
+                if download is None or download.claimed or self.client.song_lock(download.song_id).locked():
+                    continue
+                if download.claim(self.throttle):
+                    return download
+        return None
+
+    def worker(self):
+        """
+        Worker thread loop: downloads upcoming songs, throttled, until the player picks them up.
+        """
+        while True:
+            download = self.next_download()
+            if download is None:
+                with self.wake_up:
+                    self.wake_up.wait(PREFETCH_POLL)
+                continue
+            self.client.download_song(download)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+INDEX_FILE = "index.json"
+HASH_CHUNK_SIZE = 256 * 1024
+
+
+def file_sha256(path):
+    """
+    :param path: str, path of a file
+    :return: str, hex SHA-256 of the file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SongCache:
+    """
+    Songs kept on disk between plays and between runs. Every song is stored as <song id>.mp3
+    together with its SHA-256, checked against the checksum the media server sent, in an index file.
+    When the cache grows over its size limit the least recently played songs are removed.
+    Plays only update the order in memory; the index file is written when songs are added or
+    removed, and by flush when the client exits.
+    """
+    def __init__(self, folder, max_bytes=MAX_CACHE_BYTES):
+        """
+        Loads the index and drops entries whose file is missing or has the wrong size.
+        :param folder: str, the cache folder
+        :param max_bytes: int, size limit of the cached songs in bytes
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(folder, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.entries = {}  # song id (str) -> {"sha256", "size", "last_used", "verified"}
+        self.dirty = False  # the index file misses the latest last_used times
+        try:
+            with open(self.index_path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+        for song_id, entry in list(self.entries.items()):
+            path = self.path(song_id)
+            if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+                del self.entries[song_id]
+
+    def path(self, song_id):
+        """
+        :param song_id: ID of the song
+        :return: str, where the song is (or would be) stored in the cache
+        """
+        return os.path.join(self.folder, f"{song_id}.mp3")
+
+    def lookup(self, song_id):
+        """
+        Looks a song up and marks it as just used.
+        A song that was cached without a server checksum counts as missing, so it is downloaded
+        again and checked this time.
+        :param song_id: ID of the song
+        :return: str, path of the cached song, or None if it is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(str(song_id))
+            if entry is None or not entry.get("verified", True):
+                return None
+            entry["last_used"] = time.time()
+            self.dirty = True
+            return self.path(song_id)
+
+    def add(self, song_id, checksum):
+        """
+        Adds a downloaded song, stored at path(song_id), after checking its content
+        against the server's checksum. A song that does not match is deleted.
+        :param song_id: ID of the song
+        :param checksum: str, hex SHA-256 sent by the media server, or empty if the server did not have it
+                         computed yet; the song is then kept unverified, for lookup to treat as missing
+        :return: bool, True if the song was added
+        """
+        path = self.path(song_id)
+        sha256 = file_sha256(path)
+        if checksum and sha256 != checksum:
+            os.remove(path)
+            return False
+        with self.lock:
+            self.entries[str(song_id)] = {"sha256": sha256, "size": os.path.getsize(path), "last_used": time.time(),
+                                          "verified": bool(checksum)}
+            self._evict(keep=str(song_id))
+            self._save()
+        return True
+
+    def flush(self):
+        """
+        Writes the index file if plays changed the order of the songs since it was last written.
+        """
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _evict(self, keep):
+        """
+        Removes the least recently used songs until the cache fits its size limit.
+        Songs whose file cannot be removed now (e.g. it is playing) are skipped.
+        :param keep: str, song id that is never removed (the song just added)
+        """
+        total = sum(entry["size"] for entry in self.entries.values())
+        for song_id in sorted(self.entries, key=lambda i: self.entries[i]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if song_id == keep:
+                continue
+            try:
+                os.remove(self.path(song_id))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            total -= self.entries.pop(song_id)["size"]
+
+    def _save(self):
+        """
+        Writes the index to a temporary file and renames it, so the index on disk is never half written.
+        """
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.index_path)
+        self.dirty = False
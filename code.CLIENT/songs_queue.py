@@ -1,5 +1,5 @@
 import queue
-import os
+import itertools
 
 
 class SongsQueue:
@@ -24,6 +24,16 @@ class SongsQueue:
         except Exception as e:
             print(f"Error adding song to queue: {e}")
 
+    def peek(self, count):
+        """
+        Returns the next song paths in the queue without taking them out.
+
+        :param count: Maximum number of paths to return.
+        :return: List of paths, in queue order.
+        """
+        with self.my_queue.mutex:
+            return list(itertools.islice(self.my_queue.queue, count))
+
     def get_song(self, cmd):
         """
         Gets the next song path from the queue, or returns previous song if cmd == "prev".
@@ -40,11 +50,7 @@ class SongsQueue:
                     self.old_song_path = ""
                     return self.recent_song_path
                 else:
-                    if os.path.exists(self.old_song_path) and self.old_song_path != self.recent_song_path:
-                        try:
-                            os.remove(self.old_song_path)
-                        except Exception as e:
-                            print(f"Error removing old song file '{self.old_song_path}': {e}")
+                    # played songs stay in the song cache, only the history moves on
                     self.old_song_path = self.prev_song_path
                     self.prev_song_path = self.recent_song_path
 
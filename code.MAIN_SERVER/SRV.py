@@ -1,10 +1,12 @@
 import pickle
 import socket
 import threading
-from protocol import protocol_receive, protocol_send
+from concurrent import futures
+from protocol import protocol_send, FrameReader
 import logging
 import os
 from music_db import MusicDB
+from replication import ReplicationEngine
 import time
 import jwt
 import datetime
@@ -12,7 +14,7 @@ import ssl
 
 
 class MainServer:
-    def __init__(self, ip, port, cert_file, key_file, address_list, secret_key):
+    def __init__(self, ip, port, cert_file, key_file, address_list, secret_key, backlog=128, handshake_timeout=10):
         """
         Initializes the main server.
 
@@ -22,6 +24,8 @@ class MainServer:
         :param key_file: Path to the server's private key file (in PEM format).
         :param address_list: A list of addresses (e.g. media servers or other nodes).
         :param secret_key: A shared secret key used for authentication or encryption between nodes.
+        :param backlog: Accept backlog of the listening socket.
+        :param handshake_timeout: Seconds a client may take to complete the TLS handshake.
         """
         self.IP = ip
         self.PORT = port
@@ -29,9 +33,15 @@ class MainServer:
         self.KEY_FILE = key_file
         self.ADDRESS_LIST = address_list
         self.SECRET_KEY = secret_key
+        self.BACKLOG = backlog
+        self.HANDSHAKE_TIMEOUT = handshake_timeout
 
         self.CLIENTS_SOCKETS = []
         self.THREADS = []
+        self.DB_NAME = "my_db.db"
+        self.PIPELINE_WORKERS = 8
+        self.request_pool = futures.ThreadPoolExecutor(max_workers=self.PIPELINE_WORKERS)
+        self.local = threading.local()
         self.LOG_FORMAT = '%(levelname)s | %(asctime)s | %(message)s'
         self.LOG_LEVEL = logging.DEBUG
         self.LOG_DIR = 'log2'
@@ -102,130 +112,250 @@ class MainServer:
 
     def background_task(self):
         """
-        Runs periodic background tasks: server checks, song verification, and backups.
+        Runs periodic background tasks: server checks, song verification and inventory sync.
+        Missing copies of songs are made by the replication engine, which runs on its own threads.
         """
-        db = MusicDB("my_db.db", self.ADDRESS_LIST)
+        db = MusicDB(self.DB_NAME, self.ADDRESS_LIST)
+        ReplicationEngine(lambda: MusicDB(self.DB_NAME, self.ADDRESS_LIST), self.generate_token).start()
         token = self.generate_token("main_server")
-        token2 = self.generate_token("media_server")
         while True:
             db.check_server(token)
             db.verify_songs(token)
-            db.backup_songs(token, token2)
+            db.sync_inventory(token)
             time.sleep(15)
 
-    def login_signup(self, db, client_socket):
+    def login_signup(self, db, client_socket, reader):
         """
         Handles user login and signup interactions with the client.
 
         :param db: MusicDB instance.
         :param client_socket: Socket connected to the client.
+        :param reader: FrameReader of the client socket.
         :return: True if login/signup successful, False otherwise.
         """
         self.main_server_log.debug("Waiting for login or signup")
         songs_dict = pickle.dumps(db.all_songs())
 
         while True:
-            msg = protocol_receive(client_socket)
+            msg = reader.receive()
             if msg is not None:
                 cmd, data = msg
                 self.logging_protocol("receive", cmd, data)
 
-                if cmd == "sig":
-                    username, password = data
-                    success = db.add_user(username, password)
-                    token = self.generate_token(username)
-                    response_data = ["T", token, songs_dict] if success else ["F", "existing"]
-                    protocol_send(client_socket, cmd, response_data)
+                if cmd in ("sig", "log"):
+                    response_data, success = self.login_response(db, cmd, data, songs_dict)
+                    protocol_send(client_socket, cmd, response_data, reader.version, reader.request_id)
                     self.logging_protocol("send", cmd, response_data)
                     if success:
                         return True
 
-                elif cmd == "log":
-                    username, password = data
-                    is_verified, reason = db.verified_user(username, password)
-                    token = self.generate_token(username)
-
-                    if not is_verified:
-                        response_data = ["F", reason]
-                    else:
-                        liked = pickle.dumps(db.get_user_playlists(username, "liked_song"))
-                        response_data = ["T", token, songs_dict, liked]
-                    protocol_send(client_socket, cmd, response_data)
-                    self.logging_protocol("send", cmd, response_data)
-                    if is_verified:
-                        return True
-
                 elif cmd in ("ext", "error"):
                     self.main_server_log.debug("EXT command received")
                     return False
 
+    def login_response(self, db, cmd, data, songs_dict):
+        """
+        Runs a signup ("sig") or login ("log") request against the database.
+
+        :param db: MusicDB instance.
+        :param cmd: "sig" or "log".
+        :param data: [username, password].
+        :param songs_dict: Pickled song catalog to send on success.
+        :return: Tuple (response_data, success).
+        """
+        username, password = data
+        token = self.generate_token(username)
+        if cmd == "sig":
+            success = db.add_user(username, password)
+            response_data = ["T", token, songs_dict] if success else ["F", "existing"]
+            return response_data, success
+
+        is_verified, reason = db.verified_user(username, password)
+        if not is_verified:
+            response_data = ["F", reason]
+        else:
+            liked = pickle.dumps(db.get_user_playlists(username, "liked_song"))
+            response_data = ["T", token, songs_dict, liked]
+        return response_data, is_verified
+
+    def thread_db(self):
+        """
+        Returns the MusicDB connection of the calling worker thread, creating it on first use.
+        SQLite connections cannot be shared between threads, so every pipeline worker has its own.
+
+        :return: MusicDB instance.
+        """
+        if not hasattr(self.local, "db"):
+            self.local.db = MusicDB(self.DB_NAME, self.ADDRESS_LIST)
+        return self.local.db
+
+    def process_request(self, db, cmd, data):
+        """
+        Runs a single authenticated client request against the database.
+
+        :param db: MusicDB instance.
+        :param cmd: Command of the request.
+        :param data: Data items of the request (data[0] is the token).
+        :return: Response data list to send back to the client.
+        """
+        if cmd == "gad":
+            # the chosen replica first, then the others to fail over to: ["T", ip, port, ip2, port2, ...]
+            addresses = db.get_address(data[1], ranked=True)
+            response_data = ["T", *[item for address in addresses for item in address]] if addresses \
+                else ["F", "ID not found"]
+
+        elif cmd == "gab":
+            # data[1:] are song IDs, answered with a pickled {song_id: [(ip, port), ...]} dict,
+            # every song's replicas ranked as in gad
+            addresses = db.get_addresses(data[1:])
+            response_data = ["T", pickle.dumps(addresses)] if addresses is not None else ["F", "error"]
+
+        elif cmd == "pad":
+            response_data = db.add_song(data[1], data[2])
+
+        elif cmd == "rfs":
+            response_data = ["T", pickle.dumps(db.all_songs())]
+
+        elif cmd == "atp":
+            response_data = db.add_to_playlist(data[1], data[2], data[3])
+
+        elif cmd == "rfp":
+            response_data = db.remove_from_playlist(data[1], data[2], data[3])
+
+        else:
+            response_data = ["F"]
+        return response_data
+
+    def send_response(self, client_socket, send_lock, cmd, response_data, version, request_id=0):
+        """
+        Sends a response frame; the lock keeps frames of concurrent workers from interleaving.
+
+        :param client_socket: SSL wrapped client socket.
+        :param send_lock: Lock guarding writes to the client socket.
+        :param cmd: Command of the request being answered.
+        :param response_data: Response data list.
+        :param version: Protocol version negotiated on the connection.
+        :param request_id: Request ID of the request being answered.
+        """
+        with send_lock:
+            protocol_send(client_socket, cmd, response_data, version, request_id)
+        self.logging_protocol("send", cmd, response_data)
+
+    def pipelined_request(self, client_socket, send_lock, cmd, data, version, request_id):
+        """
+        Answers a pipelined request on a worker thread.
+
+        :param client_socket: SSL wrapped client socket.
+        :param send_lock: Lock guarding writes to the client socket.
+        :param cmd: Command of the request.
+        :param data: Data items of the request.
+        :param version: Protocol version negotiated on the connection.
+        :param request_id: Request ID to put on the response.
+        """
+        try:
+            response_data = self.process_request(self.thread_db(), cmd, data)
+        except Exception as e:
+            self.main_server_log.error(f"[ERROR] Exception in pipelined request {request_id}: {e}")
+            # the client waits for a reply with this request ID, so it gets an error reply
+            response_data = ["F", "error"]
+        try:
+            self.send_response(client_socket, send_lock, cmd, response_data, version, request_id)
+        except Exception as e:
+            self.main_server_log.error(f"[ERROR] Failed to send reply to pipelined request {request_id}: {e}")
+
     def handle_client(self, client_socket):
         """
         Manages communication with a connected client, handling commands and authentication.
 
+        Requests that carry a request ID are pipelined: they are answered concurrently by
+        the worker pool and the client matches the replies by ID. Requests without an ID,
+        and anything that changes the session (logout, exit, expired token), are handled
+        in order after the pipelined requests in flight have been answered.
+
         :param client_socket: SSL wrapped client socket.
         """
+        in_flight = set()
         try:
-            db = MusicDB("my_db.db", self.ADDRESS_LIST)
-            if not self.login_signup(db, client_socket):
+            db = MusicDB(self.DB_NAME, self.ADDRESS_LIST)
+            reader = FrameReader(client_socket)
+            send_lock = threading.Lock()
+            if not self.login_signup(db, client_socket, reader):
                 return
 
             while True:
-                cmd, data = protocol_receive(client_socket)
+                cmd, data = reader.receive()
+                request_id = reader.request_id
                 self.logging_protocol("receive", cmd, data)
 
                 token = data[0]
                 verification = self.verify_token(token)
 
-                if not verification["valid"]:
-                    protocol_send(client_socket, cmd, ["F", verification["error"]])
-                    self.logging_protocol("send", cmd, ["F", verification["error"]])
-                    if not self.login_signup(db, client_socket):
-                        break
+                if verification["valid"] and request_id and cmd not in ("lgu", "ext"):
+                    in_flight = {future for future in in_flight if not future.done()}
+                    in_flight.add(self.request_pool.submit(self.pipelined_request, client_socket, send_lock,
+                                                           cmd, data, reader.version, request_id))
                     continue
 
-                if cmd == "gad":
-                    address = db.get_address(data[1])
-                    response_data = ["T", *address] if address else ["F", "ID not found"]
-
-                elif cmd == "pad":
-                    response_data = db.add_song(data[1], data[2])
+                futures.wait(in_flight)
+                in_flight = set()
 
-                elif cmd == "rfs":
-                    response_data = ["T", pickle.dumps(db.all_songs())]
-
-                elif cmd == "atp":
-                    response_data = db.add_to_playlist(data[1], data[2], data[3])
-
-                elif cmd == "rfp":
-                    response_data = db.remove_from_playlist(data[1], data[2], data[3])
+                if not verification["valid"]:
+                    self.send_response(client_socket, send_lock, cmd, ["F", verification["error"]],
+                                       reader.version, request_id)
+                    if not self.login_signup(db, client_socket, reader):
+                        break
+                    continue
 
-                elif cmd == "lgu":
-                    if not self.login_signup(db, client_socket):
+                if cmd == "lgu":
+                    if not self.login_signup(db, client_socket, reader):
                         break
                     continue
 
                 elif cmd in ("ext", "error"):
                     break
-                else:
-                    response_data = ["F"]
 
-                protocol_send(client_socket, cmd, response_data)
-                self.logging_protocol("send", cmd, response_data)
+                response_data = self.process_request(db, cmd, data)
+                self.send_response(client_socket, send_lock, cmd, response_data, reader.version, request_id)
 
         except Exception as e:
             self.main_server_log.error(f"[ERROR] Exception in client handling: {e}")
         finally:
+            futures.wait(in_flight)
             client_socket.close()
             self.main_server_log.debug("Client disconnected")
 
+    def handle_connection(self, client_socket):
+        """
+        Runs on the client's own thread: completes the TLS handshake with a timeout, so a slow
+        client never holds up the accept loop, then serves the client until it disconnects.
+
+        :param client_socket: Plain accepted client socket.
+        """
+        thread = threading.current_thread()
+        ssl_socket = None
+        try:
+            client_socket.settimeout(self.HANDSHAKE_TIMEOUT)
+            ssl_socket = self.context.wrap_socket(client_socket, server_side=True)
+            ssl_socket.settimeout(None)
+            self.CLIENTS_SOCKETS.append(ssl_socket)
+            self.handle_client(ssl_socket)
+        except (socket.timeout, ssl.SSLError, OSError) as e:
+            self.main_server_log.debug(f"TLS handshake failed: {e}")
+            client_socket.close()
+        finally:
+            if ssl_socket in self.CLIENTS_SOCKETS:
+                self.CLIENTS_SOCKETS.remove(ssl_socket)
+            if thread in self.THREADS:
+                self.THREADS.remove(thread)
+
     def start_main_server(self):
         """
         Starts the server: binds socket, listens for clients, and spawns handler threads.
+        The accept loop only accepts; the TLS handshake runs on the client's thread.
         """
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.bind((self.IP, self.PORT))
-        server_socket.listen()
+        server_socket.listen(self.BACKLOG)
         self.main_server_log.debug("Server started and listening...")
 
         background = threading.Thread(target=self.background_task, daemon=True)
@@ -234,13 +364,10 @@ class MainServer:
         try:
             while True:
                 client_socket, _ = server_socket.accept()
-                ssl_socket = self.context.wrap_socket(client_socket, server_side=True)
-                self.CLIENTS_SOCKETS.append(ssl_socket)
-
-                thread = threading.Thread(target=self.handle_client, args=(ssl_socket,))
+                thread = threading.Thread(target=self.handle_connection, args=(client_socket,))
                 self.THREADS.append(thread)
                 thread.start()
-                self.main_server_log.debug(f"[ACTIVE CONNECTIONS] {threading.active_count() - 2}")
+                self.main_server_log.debug(f"[ACTIVE CONNECTIONS] {len(self.THREADS)}")
         except Exception as e:
             self.main_server_log.error(f"Server error: {e}")
         finally:
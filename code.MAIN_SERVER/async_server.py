@@ -0,0 +1,200 @@
+import asyncio
+import pickle
+import threading
+from concurrent import futures
+from protocol import AsyncFrameReader, async_protocol_send
+from SRV import MainServer
+
+
+class AsyncMainServer(MainServer):
+    def __init__(self, ip, port, cert_file, key_file, address_list, secret_key, backlog=128, handshake_timeout=10,
+                 db_workers=8, db_queue_len=256):
+        """
+        Initializes the main server in asyncio mode: every client is a task on one event loop
+        instead of a thread, TLS runs on the loop, and database work runs on a bounded executor.
+
+        :param ip: The IP address the server should bind to.
+        :param port: The TCP port number the server will listen on.
+        :param cert_file: Path to the server's SSL certificate file (in PEM format).
+        :param key_file: Path to the server's private key file (in PEM format).
+        :param address_list: A list of addresses (e.g. media servers or other nodes).
+        :param secret_key: A shared secret key used for authentication or encryption between nodes.
+        :param backlog: Accept backlog of the listening socket.
+        :param handshake_timeout: Seconds a client may take to complete the TLS handshake.
+        :param db_workers: Number of threads that run database work (each has its own MusicDB).
+        :param db_queue_len: Maximum number of database jobs queued or running at once.
+        """
+        super().__init__(ip, port, cert_file, key_file, address_list, secret_key, backlog, handshake_timeout)
+        self.db_executor = futures.ThreadPoolExecutor(max_workers=db_workers)
+        self.db_queue_len = db_queue_len
+        self.db_slots = None  # asyncio.Semaphore, created on the event loop
+
+    async def run_db(self, func, *args):
+        """
+        Runs func(db, *args) on the database executor with the worker thread's MusicDB.
+        At most db_queue_len jobs are queued at once; further callers wait on the loop.
+
+        :param func: Function taking a MusicDB as its first argument.
+        :param args: Further arguments for func.
+        :return: The return value of func.
+        """
+        async with self.db_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.db_executor, lambda: func(self.thread_db(), *args))
+
+    async def send_async(self, writer, cmd, response_data, version, request_id=0):
+        """
+        Sends a response frame to the client and logs it.
+
+        :param writer: asyncio.StreamWriter of the client.
+        :param cmd: Command of the request being answered.
+        :param response_data: Response data list.
+        :param version: Protocol version negotiated on the connection.
+        :param request_id: Request ID of the request being answered.
+        """
+        await async_protocol_send(writer, cmd, response_data, version, request_id)
+        self.logging_protocol("send", cmd, response_data)
+
+    async def login_signup_async(self, reader, writer):
+        """
+        Handles user login and signup interactions with the client, like login_signup.
+
+        :param reader: AsyncFrameReader of the client.
+        :param writer: asyncio.StreamWriter of the client.
+        :return: True if login/signup successful, False otherwise.
+        """
+        self.main_server_log.debug("Waiting for login or signup")
+        songs_dict = await self.run_db(lambda db: pickle.dumps(db.all_songs()))
+
+        while True:
+            cmd, data = await reader.receive()
+            self.logging_protocol("receive", cmd, data)
+
+            if cmd in ("sig", "log"):
+                response_data, success = await self.run_db(self.login_response, cmd, data, songs_dict)
+                await self.send_async(writer, cmd, response_data, reader.version, reader.request_id)
+                if success:
+                    return True
+
+            elif cmd in ("ext", "error"):
+                self.main_server_log.debug("EXT command received")
+                return False
+
+    async def pipelined_request_async(self, writer, cmd, data, version, request_id):
+        """
+        Answers a pipelined request as its own task.
+
+        :param writer: asyncio.StreamWriter of the client.
+        :param cmd: Command of the request.
+        :param data: Data items of the request.
+        :param version: Protocol version negotiated on the connection.
+        :param request_id: Request ID to put on the response.
+        """
+        try:
+            response_data = await self.run_db(self.process_request, cmd, data)
+        except Exception as e:
+            self.main_server_log.error(f"[ERROR] Exception in pipelined request {request_id}: {e}")
+            # the client waits for a reply with this request ID, so it gets an error reply
+            response_data = ["F", "error"]
+        try:
+            await self.send_async(writer, cmd, response_data, version, request_id)
+        except Exception as e:
+            self.main_server_log.error(f"[ERROR] Failed to send reply to pipelined request {request_id}: {e}")
+
+    async def handle_client_async(self, stream_reader, writer):
+        """
+        Manages communication with a connected client, like handle_client, as an event loop task.
+        An idle client costs only its stream buffers, not a thread.
+
+        :param stream_reader: asyncio.StreamReader of the client.
+        :param writer: asyncio.StreamWriter of the client.
+        """
+        reader = AsyncFrameReader(stream_reader)
+        in_flight = set()
+        try:
+            if not await self.login_signup_async(reader, writer):
+                return
+
+            while True:
+                cmd, data = await reader.receive()
+                request_id = reader.request_id
+                self.logging_protocol("receive", cmd, data)
+
+                token = data[0]
+                verification = self.verify_token(token)
+
+                if verification["valid"] and request_id and cmd not in ("lgu", "ext"):
+                    task = asyncio.create_task(
+                        self.pipelined_request_async(writer, cmd, data, reader.version, request_id))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    continue
+
+                if in_flight:
+                    await asyncio.wait(set(in_flight))
+
+                if not verification["valid"]:
+                    await self.send_async(writer, cmd, ["F", verification["error"]], reader.version, request_id)
+                    if not await self.login_signup_async(reader, writer):
+                        break
+                    continue
+
+                if cmd == "lgu":
+                    if not await self.login_signup_async(reader, writer):
+                        break
+                    continue
+
+                elif cmd in ("ext", "error"):
+                    break
+
+                response_data = await self.run_db(self.process_request, cmd, data)
+                await self.send_async(writer, cmd, response_data, reader.version, request_id)
+
+        except Exception as e:
+            self.main_server_log.error(f"[ERROR] Exception in client handling: {e}")
+        finally:
+            if in_flight:
+                await asyncio.wait(set(in_flight))
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception as e:
+                self.main_server_log.debug(f"Error closing client connection: {e}")
+            self.main_server_log.debug("Client disconnected")
+
+    async def serve(self):
+        """
+        Listens for clients on the event loop and handles each one as a task.
+        """
+        self.db_slots = asyncio.Semaphore(self.db_queue_len)
+        server = await asyncio.start_server(self.handle_client_async, self.IP, self.PORT, ssl=self.context,
+                                            backlog=self.BACKLOG, ssl_handshake_timeout=self.HANDSHAKE_TIMEOUT)
+        self.main_server_log.debug("Async server started and listening...")
+        async with server:
+            await server.serve_forever()
+
+    def start_main_server(self):
+        """
+        Starts the server: runs the background tasks thread and the event loop.
+        """
+        background = threading.Thread(target=self.background_task, daemon=True)
+        background.start()
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.main_server_log.error(f"Server error: {e}")
+        finally:
+            self.db_executor.shutdown(wait=False)
+            self.main_server_log.debug("Server closed")
+
+
+if __name__ == "__main__":
+    server = AsyncMainServer(
+        ip="127.0.0.1",
+        port=5555,
+        cert_file="C:/work/cyber/FinalProject/code.MAIN_SERVER/certificate_main.crt",
+        key_file="C:/work/cyber/FinalProject/code.MAIN_SERVER/privatekey_main.key",
+        address_list=[("127.0.0.1", 2222), ("127.0.0.1", 3333)],
+        secret_key="my_secret_key"
+    )
+    server.start_main_server()
@@ -0,0 +1,180 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import ssl
+import sys
+import tempfile
+import time
+from protocol import AsyncFrameReader, async_protocol_send
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CERT_FILE = os.path.join(HERE, "certificate_main.crt")
+KEY_FILE = os.path.join(HERE, "privatekey_main.key")
+IP = "127.0.0.1"
+CONNECT_BATCH = 200  # clients that log in at the same time
+
+
+def run_server(mode, port, work_dir):
+    """
+    Runs a main server in the given mode; the target of the server process.
+
+    :param mode: "thread" for MainServer or "async" for AsyncMainServer.
+    :param port: TCP port to listen on.
+    :param work_dir: Directory for the server's database and logs.
+    """
+    os.chdir(work_dir)
+    os.makedirs("log2", exist_ok=True)
+    if mode == "async":
+        from async_server import AsyncMainServer as server_class
+    else:
+        from SRV import MainServer as server_class
+    server = server_class(IP, port, CERT_FILE, KEY_FILE, [], "benchmark_secret_key_0123456789abcdef")
+    server.start_main_server()
+
+
+def process_stats(pid):
+    """
+    Reads the resident memory and thread count of a process from /proc (Linux only).
+
+    :param pid: Process ID.
+    :return: Tuple (rss_kb, threads), or (None, None) if /proc is not available.
+    """
+    try:
+        stats = {}
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                key, _, value = line.partition(":")
+                stats[key] = value.split()
+        return int(stats["VmRSS"][0]), int(stats["Threads"][0])
+    except (OSError, KeyError):
+        return None, None
+
+
+def free_port():
+    """
+    :return: A TCP port that is free on IP right now.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((IP, 0))
+        return s.getsockname()[1]
+
+
+async def open_client(port, context, index):
+    """
+    Connects one client and signs it up, leaving the connection idle and logged in.
+
+    :param port: Port of the main server.
+    :param context: Client SSL context.
+    :param index: Client number, used for a unique username.
+    :return: Tuple (reader, writer, seconds taken to connect and sign up).
+    """
+    start = time.perf_counter()
+    stream_reader, writer = await asyncio.open_connection(IP, port, ssl=context)
+    reader = AsyncFrameReader(stream_reader)
+    await async_protocol_send(writer, "sig", [f"bench_user_{index}", "password"])
+    cmd, data = await reader.receive()
+    if data[0] != "T":
+        raise RuntimeError(f"signup failed: {data}")
+    return reader, writer, time.perf_counter() - start
+
+
+async def measure(mode, port, clients, pid):
+    """
+    Connects the clients in batches, then measures the idle server and a round of requests.
+
+    :param mode: Server mode, for the report.
+    :param port: Port of the main server.
+    :param clients: Number of clients to connect.
+    :param pid: Process ID of the server.
+    :return: Dict with the results.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    rss_before, _ = process_stats(pid)
+    connections = []
+    login_times = []
+    for start in range(0, clients, CONNECT_BATCH):
+        batch = range(start, min(start + CONNECT_BATCH, clients))
+        for reader, writer, seconds in await asyncio.gather(*(open_client(port, context, i) for i in batch)):
+            connections.append((reader, writer))
+            login_times.append(seconds)
+
+    await asyncio.sleep(1)
+    rss_idle, threads_idle = process_stats(pid)
+
+    # one "rfs" per client, all at once, to see how each mode copes with a burst
+    start = time.perf_counter()
+    for reader, writer in connections:
+        await async_protocol_send(writer, "rfs", ["invalid token"])
+    for reader, writer in connections:
+        await reader.receive()
+    burst_seconds = time.perf_counter() - start
+
+    for reader, writer in connections:
+        writer.close()
+
+    login_times.sort()
+    return {
+        "mode": mode,
+        "clients": clients,
+        "rss_before_kb": rss_before,
+        "rss_idle_kb": rss_idle,
+        "threads_idle": threads_idle,
+        "login_p50_ms": login_times[len(login_times) // 2] * 1000,
+        "login_p99_ms": login_times[int(len(login_times) * 0.99)] * 1000,
+        "burst_s": burst_seconds,
+    }
+
+
+def benchmark(mode, port, clients):
+    """
+    Starts a server in the given mode in its own process, measures it and stops it.
+
+    :param mode: "thread" or "async".
+    :param port: Port for the server.
+    :param clients: Number of idle clients to hold.
+    :return: Dict with the results.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = multiprocessing.Process(target=run_server, args=(mode, port, work_dir), daemon=True)
+        server.start()
+        time.sleep(1.5)
+        try:
+            return asyncio.run(measure(mode, port, clients, server.pid))
+        finally:
+            server.terminate()
+            server.join()
+
+
+def raise_fd_limit():
+    """
+    Raises the open files limit to the hard limit, since every client holds a socket on both sides.
+    """
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+if __name__ == "__main__":
+    # usage: python benchmark.py [clients]
+    num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    raise_fd_limit()
+    results = [benchmark("thread", free_port(), num_clients), benchmark("async", free_port(), num_clients)]
+
+    print(f"{'mode':<8}{'clients':>9}{'rss idle MB':>13}{'per client KB':>15}{'threads':>9}"
+          f"{'login p50 ms':>14}{'login p99 ms':>14}{'burst s':>9}")
+    for result in results:
+        if result["rss_idle_kb"] is not None:
+            rss_idle = f"{result['rss_idle_kb'] / 1024:.1f}"
+            per_client = f"{(result['rss_idle_kb'] - result['rss_before_kb']) / result['clients']:.1f}"
+        else:
+            rss_idle = per_client = "n/a"
+        print(f"{result['mode']:<8}{result['clients']:>9}{rss_idle:>13}{per_client:>15}"
+              f"{str(result['threads_idle']):>9}{result['login_p50_ms']:>14.1f}{result['login_p99_ms']:>14.1f}"
+              f"{result['burst_s']:>9.2f}")
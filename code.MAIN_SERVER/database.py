@@ -57,6 +57,48 @@ class DataBase:
         except sqlite3.OperationalError as err:
             logging.debug(f"Error creating table: {err}")
 
+    def create_index(self, index_name, table_name, columns, unique=False, where=None):
+        """
+        Creates an index on a table if it does not exist yet.
+
+        :param index_name: Name of the index
+        :param table_name: Name of the table
+        :param columns: List of the indexed column names, in order
+        :param unique: If True, no two rows may have the same values in the indexed columns
+        :param where: Optional SQL condition; only the rows that match it are indexed (a partial index)
+        """
+        unique_sql = "UNIQUE " if unique else ""
+        query = f"CREATE {unique_sql}INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})"
+        if where:
+            query += f" WHERE {where}"
+        try:
+            self.cursor.execute(query)
+            self.conn.commit()
+            logging.debug(f"Index {index_name} created successfully!")
+        except sqlite3.OperationalError as err:
+            logging.debug(f"Error creating index: {err}")
+
+    def add_column(self, table_name, column, dtype):
+        """
+        Adds a column to an existing table if it does not have it yet (a migration of an older database file).
+
+        :param table_name: Name of the table
+        :param column: Name of the new column
+        :param dtype: Data type (and constraints) of the new column, as in create_table
+        :return: True if the column was added, False if it already existed or could not be added
+        """
+        try:
+            self.cursor.execute(f"PRAGMA table_info({table_name})")
+            if column in [row[1] for row in self.cursor.fetchall()]:
+                return False
+            self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {dtype}")
+            self.conn.commit()
+            logging.debug(f"Column {column} added to {table_name}")
+            return True
+        except sqlite3.OperationalError as err:
+            logging.debug(f"Error adding column: {err}")
+            return False
+
     def insert(self, table_name, data):
         """
         Inserts a row into a table using a parameterized query to prevent SQL injection.
@@ -154,6 +196,25 @@ class DataBase:
         except Exception as e:
             logging.debug(f"Unexpected error: {e}")
 
+    def execute_many(self, statements):
+        """
+        Runs several parameterized statements, each over many rows, in a single transaction:
+        either all the changes are applied or none of them.
+
+        :param statements: List of (query, rows) tuples, where rows is a list of parameter tuples for the query.
+        :return: True if the transaction was committed, False if it was rolled back.
+        """
+        try:
+            with self.conn:
+                for query, rows in statements:
+                    if rows:
+                        self.cursor.executemany(query, rows)
+            logging.debug(f"Transaction of {len(statements)} statements committed")
+            return True
+        except sqlite3.Error as err:
+            logging.debug(f"Transaction rolled back: {err}")
+            return False
+
     def delete(self, table_name, where):
         """
         Deletes records from a given table.
@@ -1,32 +1,88 @@
 from database import DataBase
+import sqlite3
 import socket
-from protocol import protocol_receive
-from protocol import protocol_send
+from connection_pool import ConnectionPool
+from placement import PlacementEngine, ServerLoad
+from digests import bucket_digests
 import os
 import logging
+import pickle
 import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 LOG_DIR = 'log2'
 LOG_FILE_TASK = os.path.join(LOG_DIR, 'background_task.log')
 LOG_FILE_DB = os.path.join(LOG_DIR, 'music_db.log')
 LOG_FORMAT = '%(levelname)s | %(asctime)s | %(name)s | %(message)s'
+SQL_MAX_VARIABLES = 900  # stays below SQLite's default limit of bound parameters per query
+VERIFY_BATCH_SIZE = 5000  # songs per "vrb" request, well below the 65535 items a frame can carry
+SYNC_BUCKETS_PER_REQUEST = 32  # digest buckets listed per "dgl" request
+PROBE_WORKERS = 32  # media servers probed at the same time by check_server
+PROBE_WINDOW = 5  # recent probes remembered per server by the failure detector
+PROBE_FAILURES = 3  # failed probes within the window that mark an active server fallen
+PROBE_RECOVERIES = 2  # consecutive successful probes that mark a fallen server active again
+LATENCY_SMOOTHING = 0.3  # weight of a new latency sample in the server's moving average
+DEFAULT_REPLICATION = 2  # copies kept of a song unless its replication factor is set otherwise
+REPLICATION_PLAN_LIMIT = 1000  # under-replicated songs planned per pass
+REPLICATION_MAX_ATTEMPTS = 3  # transfers of a replication job before it is given up
+REPLICATION_RETRY_AFTER = 3600  # seconds before a song whose job was given up is planned again
+REPLICATION_BACKOFF = 30  # seconds before a failed job is tried again, doubled with every attempt
+REPLICATION_BUSY_DELAY = 5  # seconds before a job a media server was too busy for is tried again
 
 
 class MusicDB(DataBase):
-    def __init__(self, name, address_list):
+    def __init__(self, name, address_list, media_pool=None):
+        """
+        :param name: File name of the SQLite database.
+        :param address_list: List of (ip, port) of the media servers.
+        :param media_pool: ConnectionPool to the media servers shared with other jobs (a new one by default).
+        """
         super().__init__(name)
         self.address_list = address_list
         songs_columns = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT",
                          "name": "TEXT NOT NULL",
                          "artist": "TEXT NOT NULL",
-                         "IP1":  "TEXT NOT NULL",
-                         "port1": "INTEGER NOT NULL",
-                         "setting1": "TEXT NOT NULL",
-                         "IP2": "TEXT ",
-                         "port2": "INTEGER",
-                         "setting2": "TEXT"}
+                         "replication": f"INTEGER NOT NULL DEFAULT {DEFAULT_REPLICATION}",
+                         "replicas": "INTEGER NOT NULL DEFAULT 0"}
         self.create_table("songs", songs_columns)
 
+        # one row per copy of a song on a media server; setting is 'pending' until the copy is verified
+        replicas_columns = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                            "song_id": "INTEGER NOT NULL",
+                            "IP": "TEXT NOT NULL",
+                            "port": "INTEGER NOT NULL",
+                            "setting": "TEXT NOT NULL"}
+        self.create_table("song_replicas", replicas_columns, [("song_id", "songs", "id")])
+        self.create_index("replicas_song_server", "song_replicas", ["song_id", "IP", "port"], unique=True)
+        self.create_index("replicas_server", "song_replicas", ["IP", "port", "song_id"])
+        self.create_index("replicas_setting", "song_replicas", ["setting"])
+        self.migrate_replicas()
+        # songs.replicas counts a song's rows in song_replicas, kept up to date by triggers, so that the
+        # under-replicated songs are found through a partial index instead of by counting every song's replicas
+        if self.add_column("songs", "replicas", "INTEGER NOT NULL DEFAULT 0"):
+            self.cursor.execute("UPDATE songs SET replicas = "
+                                "(SELECT COUNT(*) FROM song_replicas WHERE song_replicas.song_id = songs.id)")
+            self.conn.commit()
+        self.create_replica_counters()
+        self.create_index("songs_under_replicated", "songs", ["id"], where="replicas < replication")
+
+        # copies of songs to be made; they survive a restart, see ReplicationEngine
+        jobs_columns = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                        "song_id": "INTEGER NOT NULL",
+                        "source_IP": "TEXT NOT NULL",
+                        "source_port": "INTEGER NOT NULL",
+                        "target_IP": "TEXT NOT NULL",
+                        "target_port": "INTEGER NOT NULL",
+                        "state": "TEXT NOT NULL",  # 'queued', 'running' or 'failed'
+                        "attempts": "INTEGER NOT NULL DEFAULT 0",
+                        "error": "TEXT"}
+        self.create_table("replication_jobs", jobs_columns, [("song_id", "songs", "id")])
+        self.create_index("jobs_state", "replication_jobs", ["state", "id"])
+        self.create_index("jobs_song", "replication_jobs", ["song_id", "state"])
+        self.add_column("replication_jobs", "failed_at", "REAL")  # when the job was given up
+        self.add_column("replication_jobs", "not_before", "REAL")  # a queued job does not start before this time
+
         users_columns = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT",
                          "username": "TEXT NOT NULL",
                          "password": "TEXT NOT NULL",
@@ -50,6 +106,14 @@ class MusicDB(DataBase):
             "setting": "TEXT NOT NULL"
         }
         self.create_table("servers", server_columns)
+        # health columns, added to databases created before they existed
+        self.add_column("servers", "latency", "REAL")  # moving average of the probe round trip, ms
+        self.add_column("servers", "last_seen", "REAL")  # time of the last successful probe
+        self.add_column("servers", "probes", "TEXT DEFAULT ''")  # recent probe results, oldest first: 1 ok, 0 failed
+        # load reported by the last successful probe, used by the placement engine
+        self.add_column("servers", "free_bytes", "INTEGER")
+        self.add_column("servers", "streams", "INTEGER")
+        self.add_column("servers", "song_count", "INTEGER")
         existing_servers = self.select("servers")
         if not existing_servers:
             self.insert_server_columns()
@@ -62,6 +126,56 @@ class MusicDB(DataBase):
         self.context2 = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
         self.context2.check_hostname = False
         self.context2.verify_mode = ssl.CERT_NONE
+        # long-lived connections to the media servers, reused by every background job
+        self.media_pool = media_pool or ConnectionPool(self.context2)
+        self.placement = PlacementEngine()
+
+    def migrate_replicas(self):
+        """
+        Moves the replicas of a database from before song_replicas existed, kept in the songs columns
+        IP1/port1/setting1 and IP2/port2/setting2, into song_replicas, and rebuilds the songs table without them.
+        Runs in one transaction; a database that has no such columns is left as it is.
+        """
+        self.cursor.execute("PRAGMA table_info(songs)")
+        if "IP1" not in [row[1] for row in self.cursor.fetchall()]:
+            return
+        try:
+            with self.conn:
+                for number in (1, 2):
+                    self.cursor.execute(f"""
+                        INSERT OR IGNORE INTO song_replicas (song_id, IP, port, setting)
+                        SELECT id, IP{number}, port{number}, setting{number} FROM songs
+                        WHERE IP{number} IS NOT NULL AND IP{number} != '' AND setting{number} IN ('pending', 'verified')
+                    """)
+                # SQLite cannot drop NOT NULL columns, so the table is copied without them
+                self.cursor.execute(f"""
+                    CREATE TABLE songs_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                                            artist TEXT NOT NULL,
+                                            replication INTEGER NOT NULL DEFAULT {DEFAULT_REPLICATION})
+                """)
+                self.cursor.execute("INSERT INTO songs_new (id, name, artist) SELECT id, name, artist FROM songs")
+                self.cursor.execute("DROP TABLE songs")
+                self.cursor.execute("ALTER TABLE songs_new RENAME TO songs")
+            logging.debug("Song replicas moved to song_replicas")
+        except sqlite3.Error as err:
+            logging.debug(f"Error migrating song replicas: {err}")
+
+    def create_replica_counters(self):
+        """
+        Creates the triggers that keep songs.replicas equal to the number of the song's rows in song_replicas.
+        """
+        try:
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS replicas_added AFTER INSERT ON song_replicas
+                BEGIN UPDATE songs SET replicas = replicas + 1 WHERE id = NEW.song_id; END
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS replicas_removed AFTER DELETE ON song_replicas
+                BEGIN UPDATE songs SET replicas = replicas - 1 WHERE id = OLD.song_id; END
+            """)
+            self.conn.commit()
+        except sqlite3.OperationalError as err:
+            logging.debug(f"Error creating replica triggers: {err}")
 
     def insert_server_columns(self):
         for server in self.address_list:
@@ -149,52 +263,57 @@ class MusicDB(DataBase):
 
     def all_songs(self):
         """
-        Retrieves all songs from the 'songs' table where either 'setting1' or 'setting2' is 'verified'.
+        Retrieves all songs that have at least one verified replica.
 
         Returns: dict: A dictionary where each key is a song name and the value is a tuple (artist, id).
         """
         song_dict = {}
         try:
-            songs = self.select("songs", 'id,name,artist', {"setting1": "verified", "setting2": "verified"}, "OR")
-            for i in songs:
-                name = i[1]
-                artist = i[2]
-                song_id = i[0]
+            self.cursor.execute("""
+                SELECT id, name, artist FROM songs
+                WHERE EXISTS (SELECT 1 FROM song_replicas
+                              WHERE song_replicas.song_id = songs.id AND song_replicas.setting = 'verified')
+            """)
+            for song_id, name, artist in self.cursor.fetchall():
                 song_dict[name] = (artist, song_id)
         except Exception as e:
             self.music_db_log.debug(f"Error in all_songs: {e}")
         return song_dict
 
 # ******************************************************************************
-    def find_address(self):
+    def find_address(self, exclude=()):
         """
-        Randomly selects an active server address from the address list.
+        Chooses an active server for a new song or a backup copy with the placement engine,
+        by the load the servers reported to check_server (free disk, streams, latency, song count).
+        The chosen server's song and stream counts are raised right away, so the songs placed before
+        the next probe (which reports the real counts again) do not all go to the same server.
 
-        This method continuously picks a random address (IP, port) from self.address_list,
-        queries the 'servers' table to check if the server at that address has a setting
-        of "active". It loops until it finds an active server.
-
-        Returns:
-            tuple: (IP, port) of an active server if found.
-            None: If an exception occurs during the process.
+        :param exclude: Addresses (IP, port) that must not be chosen, e.g. the server that already has the song.
+        :return: Tuple (IP, port) of the chosen server, or None if no active server can take the song.
         """
-        import random
-        check = False
-        address = ()
-
-        while not check:
-            try:
-                index = random.randint(0, len(self.address_list)-1)
-                address = self.address_list[index]
-                server = self.select("servers", "*", {"IP": address[0], "port": address[1]})
-                setting = server[0][3]  # Index 3 corresponds to the 'setting' column
-                if setting == "active":
-                    check = True
-            except Exception as e:
-                self.music_db_log.debug(f"Error in find_address: {e}")
+        try:
+            address = self.placement.choose(self.server_loads(), exclude)
+            if address is None:
+                self.music_db_log.debug(f"find_address: No usable server (excluding {list(exclude)})")
                 return None
+            # a count the server did not report yet stays unknown (NULL counts as average)
+            self.cursor.execute("UPDATE servers SET song_count = song_count + 1, streams = COALESCE(streams, 0) + 1 "
+                                "WHERE IP = ? AND port = ?", [address[0], address[1]])
+            self.conn.commit()
+            return address
+        except Exception as e:
+            self.music_db_log.debug(f"Error in find_address: {e}")
+            return None
 
-        return address
+    def server_loads(self):
+        """
+        :return: List of ServerLoad of the active servers in self.address_list.
+        """
+        known = {tuple(address) for address in self.address_list}
+        rows = self.select("servers", "IP, port, latency, free_bytes, streams, song_count", {"setting": "active"})
+        return [ServerLoad((ip, int(port)), latency, free, streams, songs)
+                for ip, port, latency, free, streams, songs in rows or []
+                if (ip, int(port)) in known]
 
     def add_song(self, song_name, artist):
         """
@@ -212,7 +331,6 @@ class MusicDB(DataBase):
                 self.music_db_log.debug(f"add_song: Song already exists: {existing}")
                 return ["F", "existing"]
 
-            data = {"name": song_name, "artist": artist}
             address = self.find_address()
             if not address:
                 self.music_db_log.debug("add_song: No active server address found.")
@@ -220,10 +338,7 @@ class MusicDB(DataBase):
 
             ip = address[0]
             port = address[1]
-            data["IP1"] = ip
-            data["port1"] = port
-            data["setting1"] = "pending"
-            self.insert("songs", data)
+            self.insert("songs", {"name": song_name, "artist": artist})
 
             song_id = self.select("songs", "id", {"name": song_name, "artist": artist})
             if not song_id:
@@ -231,6 +346,7 @@ class MusicDB(DataBase):
                 return ["F", "insert_failed"]
 
             song_id = str(song_id[0][0])
+            self.insert("song_replicas", {"song_id": int(song_id), "IP": ip, "port": port, "setting": "pending"})
             self.music_db_log.debug(f"add_song: Added song '{song_name}' by '{artist}' with ID {song_id} at {ip}:{port}")
             self.music_db_log.debug(song_id)
             return ["T", song_id, ip, port]
@@ -239,49 +355,80 @@ class MusicDB(DataBase):
             self.music_db_log.debug(f"add_song: Exception occurred adding song '{song_name}' by '{artist}' - {e}")
             return ["F", "error"]
 
-    def get_address(self, song_id):
+    def get_address(self, song_id, ranked=False):
         """
         Retrieves an active server address (IP, port) that hosts the song with the given song_id.
 
-        Checks two possible server addresses associated with the song and returns the first one
-        where both the song's setting is "verified" and the server's setting is "active".
+        Every replica whose song setting is "verified" and whose server setting is "active" can serve
+        the song; the placement engine picks among them by load and latency (see PlacementEngine.route),
+        so the reads of one song are spread over its replicas.
 
         :param song_id: The ID of the song to find the server address for.
-        :return: Tuple (IP, port) of the active server hosting the song, or None if none found or song doesn't exist.
+        :param ranked: If True, return all usable replicas in the order the client should try them.
+        :return: Tuple (IP, port) of the chosen server (a list of them if ranked), or None if none found
+                 or the song doesn't exist.
         """
         try:
-            song = self.select("songs", '*', {"id": song_id})
-            if not song:
-                self.music_db_log.debug(f"get_address: No song found with id {song_id}")
-                return None
-
-            song = song[0]
-            self.music_db_log.debug(f"get_address: Retrieved song record: {song}")
-
-            address1 = (song[3], int(song[4]))
-            song_set1 = song[5]
-            server1 = self.select("servers", "*", {"IP": address1[0], "port": address1[1]})
-            server_set1 = server1[0][3]  # setting column index
-
-            address2 = (song[6], int(song[7]))
-            song_set2 = song[8]
-            server2 = self.select("servers", "*", {"IP": address2[0], "port": address2[1]})
-            server_set2 = server2[0][3]
-
-            if song_set1 == "verified" and server_set1 == "active":
-                self.music_db_log.debug(f"get_address: Returning address1 {address1}")
-                return address1
-            elif song_set2 == "verified" and server_set2 == "active":
-                self.music_db_log.debug(f"get_address: Returning address2 {address2}")
-                return address2
-            else:
+            replicas = self._get_replicas([int(song_id)]).get(int(song_id))
+            if not replicas:
                 self.music_db_log.debug(f"get_address: No active server found for song_id {song_id}")
                 return None
+            addresses = self.placement.route(replicas)
+            self.music_db_log.debug(f"get_address: Returning {addresses} for song_id {song_id}")
+            return addresses if ranked else addresses[0]
 
         except Exception as e:
             self.music_db_log.debug(f"get_address: Exception occurred for song_id {song_id} - {e}")
             return None
 
+    def get_addresses(self, song_ids):
+        """
+        Retrieves the active server addresses of each of several songs with one joined query
+        (one query per SQL_MAX_VARIABLES songs).
+
+        Every song gets its replicas ranked the same way as in get_address(ranked=True),
+        so the client can fail over to the song's other replicas.
+
+        :param song_ids: List of song IDs to find server addresses for.
+        :return: Dict {song_id: [(IP, port), ...]} for the songs that have an active replica, the one to
+                 read from first, or None on error. Songs without an active replica are left out.
+        """
+        try:
+            ids = [int(song_id) for song_id in song_ids]
+            addresses = {}
+            for start in range(0, len(ids), SQL_MAX_VARIABLES):
+                for song_id, replicas in self._get_replicas(ids[start:start + SQL_MAX_VARIABLES]).items():
+                    addresses[song_id] = self.placement.route(replicas)
+            self.music_db_log.debug(f"get_addresses: {len(addresses)} of {len(ids)} songs have an active server")
+            return addresses
+
+        except Exception as e:
+            self.music_db_log.debug(f"get_addresses: Exception occurred for {song_ids} - {e}")
+            return None
+
+    def _get_replicas(self, ids):
+        """
+        Finds the readable replicas of at most SQL_MAX_VARIABLES songs, with their servers' load,
+        in one joined query.
+
+        :param ids: List of integer song IDs.
+        :return: Dict {song_id: [ServerLoad]} for the songs that have a verified replica on an active server.
+        """
+        placeholders = ", ".join(["?"] * len(ids))
+        query = f"""
+            SELECT song_replicas.song_id, servers.IP, servers.port, servers.latency, servers.free_bytes,
+                   servers.streams, servers.song_count
+            FROM song_replicas
+            JOIN servers ON servers.IP = song_replicas.IP AND servers.port = song_replicas.port
+            WHERE song_replicas.song_id IN ({placeholders})
+              AND song_replicas.setting = 'verified' AND servers.setting = 'active'
+        """
+        self.cursor.execute(query, ids)
+        replicas = {}
+        for song_id, ip, port, latency, free, streams, songs in self.cursor.fetchall():
+            replicas.setdefault(song_id, []).append(ServerLoad((ip, int(port)), latency, free, streams, songs))
+        return replicas
+
     # ******************************************************************************
     def add_to_playlist(self, username, playlist_name, song_id):
         """
@@ -396,76 +543,67 @@ class MusicDB(DataBase):
             return []
 
 # ****************************************************************
-    def create_ssl_socket(self, client_socket, ip):
+    def media_request(self, address, cmd, data):
         """
-        Wraps a plain TCP socket with SSL/TLS encryption using the client's SSL context.
-
-        :param client_socket: A plain (non-encrypted) socket.socket object.
-        :param ip: The server's IP address or hostname used for SSL hostname verification.
-        :return: An SSL-wrapped socket with a timeout of 5 seconds set.
-        :raises ssl.SSLError: If an SSL-related error occurs during wrapping.
-        :raises socket.error: If a socket-related error occurs.
+        Sends one request to a media server on a pooled connection and returns its reply.
+        A connection whose reply failed is closed; a healthy one goes back to the pool.
+
+        :param address: Tuple (IP, port) of the media server.
+        :param cmd: Command of the request.
+        :param data: Data items of the request.
+        :return: Tuple (cmd, data) of the reply, ("error", [message]) if no reply was received.
+        :raises socket.error: If the server cannot be reached.
         """
-        try:
-            ssl_socket = self.context2.wrap_socket(client_socket, server_hostname=ip)
-            ssl_socket.settimeout(5)
-            return ssl_socket
-        except ssl.SSLError as ssl_err:
-            logging.error(f"SSL error while wrapping socket: {ssl_err}")
-            raise  # אפשר להעביר את השגיאה הלאה או לטפל כאן בהתאם
-        except socket.error as sock_err:
-            logging.error(f"Socket error while setting up SSL socket: {sock_err}")
-            raise
-        except Exception as e:
-            logging.error(f"Unexpected error in create_ssl_socket: {e}")
-            raise
+        self.logging_protocol("send", cmd, data)
+        conn, cmd, data = self.media_pool.request(address, cmd, data)
+        if cmd == "error":
+            conn.close()
+        else:
+            self.media_pool.release(conn)
+        self.logging_protocol("recv", cmd, data)
+        return cmd, data
 
     def check_server(self, token):
         """
-        Checks each server in self.address_list by sending a 'hlo' command with the given token.
-        Updates the server's setting to 'active' if response data[0] == "T", otherwise 'fallen'.
+        Probes all servers in self.address_list at the same time with a 'hlo' command,
+        so a dead server delays the check by at most one timeout, not one timeout per server.
+        Every probe's round trip is recorded in the servers table, and the server's setting changes
+        only by a PROBE_FAILURES-of-PROBE_WINDOW failure detector with hysteresis, so one lost probe
+        does not make a server flap:
+        - an active (or pending) server becomes 'fallen' when PROBE_FAILURES of its last PROBE_WINDOW probes failed;
+        - a fallen (or pending) server becomes 'active' after PROBE_RECOVERIES successful probes in a row.
+        A pending server that answers its first probe becomes active right away.
 
         :param token: Token string sent to servers for verification.
         """
-        setting = None
-        address = None
         try:
-            cmd = "hlo"
-            for address in self.address_list:
-                data = [token]
-                server = self.select("servers", "*", {"IP": address[0], "port": address[1]})
-                setting = server[0][3]  # setting column index
-                ssl_socket = None
-                try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    ssl_socket = self.create_ssl_socket(s, address[0])
-                    ssl_socket.connect(address)  # address is (host, port) tuple
-
-                    protocol_send(ssl_socket, cmd, data)
-                    self.logging_protocol("send", cmd, data)
-                    cmd_resp, data_resp = protocol_receive(ssl_socket)
-                    self.logging_protocol("receive", cmd_resp, data_resp)
-
-                    if data_resp[0] == "T":
-                        if setting != "active":
-                            self.task_log.debug(f"Server {address} responded with 'T'. Marking as active.")
-                            self.update("servers", {"setting": "active"}, {"IP": address[0], "port": address[1]})
-                    else:
-                        self.task_log.debug(f"Server {address} responded with unexpected message: {data_resp}")
-                        if setting != "fallen":
-                            self.update("servers", {"setting": "fallen"}, {"IP": address[0], "port": address[1]},)
-                except socket.timeout:
-                    self.task_log.debug(f"Server {address} timed out.")
-                    if setting != "fallen":
-                        self.update("servers", {"setting": "fallen"}, {"IP": address[0], "port": address[1]},)
-
-                except socket.error as e:
-                    self.task_log.debug(f"Socket error with server address: {e}, {address}")
-                    if setting is not None and setting != "fallen" and address is not None:
-                        self.update("servers", {"setting": "fallen"}, {"IP": address[0], "port": address[1]},)
-                finally:
-                    if ssl_socket:
-                        ssl_socket.close()
+            with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, max(len(self.address_list), 1))) as pool:
+                results = list(pool.map(lambda address: self.probe_server(token, address), self.address_list))
+
+            now = time.time()
+            for address, (ok, latency, stats) in zip(self.address_list, results):
+                server = self.select("servers", "setting, latency, probes", {"IP": address[0], "port": address[1]})
+                if not server:
+                    continue
+                setting, average, probes = server[0]
+                probes = ((probes or "") + ("1" if ok else "0"))[-PROBE_WINDOW:]
+                updates = {"probes": probes}
+                if ok:
+                    average = latency if average is None else (
+                        LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * average)
+                    updates.update({"latency": round(average, 3), "last_seen": now})
+                    if stats:
+                        updates.update({"free_bytes": stats.get("free"), "song_count": stats.get("songs"),
+                                        "streams": stats.get("streams", 0) + stats.get("uploads", 0)})
+
+                new_setting = self.detect_failure(setting, probes)
+                if new_setting != setting:
+                    self.task_log.debug(f"Server {address} is now {new_setting} (recent probes {probes}).")
+                    updates["setting"] = new_setting
+                    if new_setting == "active":
+                        # older failures do not count against a server that just recovered
+                        updates["probes"] = probes[-PROBE_RECOVERIES:]
+                self.update("servers", updates, {"IP": address[0], "port": address[1]})
 
         except Exception as e:
             self.task_log.debug(f"error in check servers: {e}")
@@ -473,154 +611,385 @@ class MusicDB(DataBase):
             fallen_servers = self.select("servers", "*", {"setting": "fallen"})
             self.task_log.debug(f"Current servers state: {fallen_servers}")
 
+    @staticmethod
+    def detect_failure(setting, probes):
+        """
+        :param setting: Current setting of the server ('pending', 'active' or 'fallen').
+        :param probes: Recent probe results of the server, oldest first ('1' ok, '0' failed).
+        :return: The server's new setting.
+        """
+        if setting != "fallen" and probes.count("0") >= PROBE_FAILURES:
+            return "fallen"
+        if setting == "pending" and probes.endswith("1"):
+            return "active"
+        if setting == "fallen" and probes.endswith("1" * PROBE_RECOVERIES):
+            return "active"
+        return setting
+
+    def probe_server(self, token, address):
+        """
+        Sends one 'hlo' probe to a media server. Runs on a probe thread, so it does not use the database.
+
+        :param token: Token string sent to the server for verification.
+        :param address: Tuple (IP, port) of the media server.
+        :return: Tuple (ok, latency, stats): whether the server answered 'T', the round trip in milliseconds,
+                 and the load stats dict the server sent with the reply (None if it sent none).
+        """
+        start = time.perf_counter()
+        try:
+            cmd_resp, data_resp = self.media_request(address, "hlo", [token])
+            latency = (time.perf_counter() - start) * 1000
+            if data_resp[0] == "T":
+                stats = pickle.loads(data_resp[1]) if len(data_resp) > 1 else None
+                return True, latency, stats
+            self.task_log.debug(f"Server {address} responded with unexpected message: {data_resp}")
+        except socket.timeout:
+            self.task_log.debug(f"Server {address} timed out.")
+        except socket.error as e:
+            self.task_log.debug(f"Socket error with server address: {e}, {address}")
+        return False, None, None
+
     def verify_songs(self, token):
         """
-       Verify songs that are marked as 'pending' and update their status based on availability.
+       Verify song replicas that are marked as 'pending' and update their status based on availability.
+       Every media server gets one batch request per VERIFY_BATCH_SIZE songs, and all the results
+       are applied in a single transaction.
 
        :param token: Access token used to authenticate with the media server during verification.
        """
         try:
-            # Fetch songs pending verification
-            songs_pending = self.select("songs", '*', {"setting1": "pending", "setting2": "pending"}, "OR")
-            self.task_log.debug(f"Found {len(songs_pending)} pending songs to verify.")
-            for song in songs_pending:
-                try:
-                    song_id = str(song[0])
-                    setting = ""
-                    if song[5] == "pending":
-                        ip1 = song[3]
-                        port1 = song[4]
-                        setting = "setting1"
-                    elif song[8] == "pending":
-                        ip1 = song[6]
-                        port1 = song[7]
-                        setting = "setting2"
-
-                    if setting != "":
-                        self.task_log.debug(f"Verifying song_id {song_id} at {ip1}:{port1} ({setting})")
-                        result = self.verify_songs_func(token, song_id, (ip1, int(port1)))
-                        self.task_log.debug(f"Verification result for song_id {song_id}: {result}")
-
-                        if result[1] == "found":
-                            self.update("songs", {setting: "verified"}, {"id": song_id})
-                            self.task_log.info(f"Song ID {song_id} verified successfully on {setting}.")
-                        elif result[1] == "lost":
-                            self.task_log.warning(f"Song ID {song_id} lost on {setting}, clearing data.")
-                            if setting == "setting2":
-                                self.update("songs", {"ip2": "", "port2": "", "setting2": ""}, {"id": song_id})
-                            elif setting == "setting1":
-                                self.update("songs", {"ip1": "", "port1": "", "setting1": ""}, {"id": song_id})
-
-                except ValueError as e:
-                    err_msg = f"Error converting port to integer for song ID {e}"
-                    self.task_log.error(err_msg)
-                except Exception as e:
-                    err_msg = f"Unexpected error processing song ID {e}"
-                    self.task_log.error(err_msg)
+            # Fetch replicas pending verification
+            replicas_pending = self.select("song_replicas", "song_id, IP, port", {"setting": "pending"})
+            self.task_log.debug(f"Found {len(replicas_pending)} pending song replicas to verify.")
+
+            pending = {}  # (ip, port) -> list of song IDs to verify there
+            for song_id, ip, port in replicas_pending:
+                pending.setdefault((ip, int(port)), []).append(str(song_id))
+
+            verified = []
+            lost = []
+            for address, song_ids in pending.items():
+                for start in range(0, len(song_ids), VERIFY_BATCH_SIZE):
+                    chunk = song_ids[start:start + VERIFY_BATCH_SIZE]
+                    result = self.verify_batch(token, chunk, address)
+                    if result is None:
+                        continue
+                    found_ids = set(result["found"])
+                    lost_ids = set(result["lost"])
+                    for song_id in chunk:
+                        if song_id in found_ids:
+                            verified.append((int(song_id), address[0], address[1]))
+                        elif song_id in lost_ids:
+                            self.task_log.warning(f"Song ID {song_id} lost on {address}, removing the replica.")
+                            lost.append((int(song_id), address[0], address[1]))
+
+            statements = [
+                ("UPDATE song_replicas SET setting = 'verified' WHERE song_id = ? AND IP = ? AND port = ?", verified),
+                ("DELETE FROM song_replicas WHERE song_id = ? AND IP = ? AND port = ?", lost),
+            ]
+            if self.execute_many(statements):
+                self.task_log.info(f"Verified {len(verified)} song copies, {len(lost)} lost.")
 
         except Exception as e:
             err_msg = f"Database or connection error in verify_songs: {e}"
             self.task_log.error(err_msg)
 
-    def verify_songs_func(self, token, song_id, server_address):
+    def verify_batch(self, token, song_ids, server_address):
         """
-        Verify availability of a song file on a media server.
+        Verify availability of many song files on one media server with a single "vrb" request.
 
         :param token: Authentication token
-        :param song_id: int - ID of the song to verify
+        :param song_ids: list of str - IDs of the songs to verify
         :param server_address: tuple (ip:str, port:int) of media server
-        :return: response data from server, or None on failure
+        :return: dict {"found": [song_id], "lost": [song_id]}, or None on failure
         """
         try:
-            self.task_log.debug(f"Connecting to media server at {server_address} for song ID {song_id}")
-            media_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            ssl_socket = self.create_ssl_socket(media_socket, server_address[0])
-            ssl_socket.connect(server_address)
-            self.task_log.info("Connection with media server successful!")
-            cmd = "vrf"
-            data = [token, song_id]
-            protocol_send(ssl_socket, cmd, data)
-            self.logging_protocol("send", cmd, data)
-            cmd, data = protocol_receive(ssl_socket)  # "get", [file_name, file_bytes]
-            self.logging_protocol("recv", cmd, data)
-            ssl_socket.close()
-            return data
+            self.task_log.debug(f"Verifying {len(song_ids)} songs on media server {server_address}")
+            cmd, data = self.media_request(server_address, "vrb", [token, *song_ids])
+            if data[0] != "T":
+                self.task_log.error(f"Batch verify failed on {server_address}: {data}")
+                return None
+            return pickle.loads(data[1])
 
         except socket.error as e:
             err_msg = f"Connection failed to media server {server_address}: {e}"
             self.task_log.error(err_msg)
+            return None
 
-    def backup_songs(self, token, token2):
+    def sync_inventory(self, token):
+        """
+        Anti-entropy: brings song_replicas in line with what every active media server really stores.
+        Each server publishes a digest per bucket of song IDs, and the same digests are computed from the
+        verified song_replicas rows of the server; only the buckets where the two differ are listed and compared
+        row by row, so when the table and the server agree this costs one small "dgs" request per server.
+
+        - A verified copy the server does not have is removed, so the replication engine replaces it.
+        - A pending copy the server has is marked verified.
+        - A song the server has but the table does not place there is recorded as a verified replica.
+        Songs with a queued or running replication job are left alone until the job is finished,
+        and so are rows added after the sync of the server started, which a listing may not show yet.
+
+        :param token: Access token used to authenticate with the media servers.
         """
-        Backup songs that are verified but exist on only one server.
+        for address in self.address_list:
+            try:
+                server = self.select("servers", "setting", {"IP": address[0], "port": address[1]})
+                if not server or server[0][0] != "active":
+                    continue
+                self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM song_replicas")
+                last_row = self.cursor.fetchone()[0]
+                cmd, data = self.media_request(address, "dgs", [token])
+                if data[0] != "T":
+                    self.task_log.error(f"Digest request failed on {address}: {data}")
+                    continue
+                digest = pickle.loads(data[1])
+                bucket_count = digest["buckets"]
+                placed = self.select("song_replicas", "song_id",
+                                     {"IP": address[0], "port": address[1], "setting": "verified"})
+                expected = bucket_digests((str(song_id) for song_id, in placed or []), bucket_count)
+                changed = [bucket for bucket, value in enumerate(digest["digests"]) if value != expected[bucket]]
+                if not changed:
+                    continue
+                self.task_log.debug(f"{len(changed)} digest buckets of {address} differ from song_replicas")
+                for start in range(0, len(changed), SYNC_BUCKETS_PER_REQUEST):
+                    buckets = changed[start:start + SYNC_BUCKETS_PER_REQUEST]
+                    cmd, data = self.media_request(address, "dgl", [token, *buckets])
+                    if data[0] != "T":
+                        self.task_log.error(f"Bucket listing failed on {address}: {data}")
+                        break
+                    self._sync_buckets(address, bucket_count, pickle.loads(data[1]), last_row)
+            except socket.error as e:
+                self.task_log.error(f"Connection failed to media server {address} during sync: {e}")
+            except Exception as e:
+                self.task_log.error(f"Error in sync_inventory for {address}: {e}")
+
+    def _sync_buckets(self, address, bucket_count, listing, last_row):
+        """
+        Compares the listed buckets of one media server with song_replicas and applies the differences
+        in one transaction.
+
+        :param address: Tuple (IP, port) of the media server.
+        :param bucket_count: Number of digest buckets of the server (songs are bucketed by id % bucket_count).
+        :param listing: Dict {bucket: (digest, [song names])} from a "dgl" reply.
+        :param last_row: Highest song_replicas id when the sync started; newer rows may be missing from
+                         the listing and are not removed.
+        """
+        stored = {int(song_name) for digest, songs in listing.values() for song_name in songs if song_name.isdigit()}
+        buckets = list(listing)
+        placeholders = ", ".join(["?"] * len(buckets))
+        self.cursor.execute(f"""
+            SELECT DISTINCT song_id FROM replication_jobs
+            WHERE state IN ('queued', 'running') AND song_id % ? IN ({placeholders})
+        """, [bucket_count, *buckets])
+        in_flight = {song_id for song_id, in self.cursor.fetchall()}
+        self.cursor.execute(f"""
+            SELECT id, song_id, setting FROM song_replicas
+            WHERE IP = ? AND port = ? AND song_id % ? IN ({placeholders})
+        """, [address[0], address[1], bucket_count, *buckets])
+
+        verified = []
+        lost = []
+        placed = set()
+        for row_id, song_id, setting in self.cursor.fetchall():
+            placed.add(song_id)
+            if song_id in in_flight:
+                continue
+            if song_id in stored and setting == "pending":
+                verified.append((song_id, address[0], address[1]))
+            elif song_id not in stored and setting == "verified" and row_id <= last_row:
+                self.task_log.warning(f"Song ID {song_id} missing on {address}, removing the replica.")
+                lost.append((song_id, address[0], address[1]))
+
+        strays = sorted(stored - placed - in_flight)
+        found = []
+        for start in range(0, len(strays), SQL_MAX_VARIABLES):
+            chunk = strays[start:start + SQL_MAX_VARIABLES]
+            self.cursor.execute(f"SELECT id FROM songs WHERE id IN ({', '.join(['?'] * len(chunk))})", chunk)
+            found.extend((song_id, address[0], address[1]) for song_id, in self.cursor.fetchall())
+        if len(found) < len(strays):
+            self.task_log.warning(f"{len(strays) - len(found)} files on {address} belong to no song")
+
+        statements = [
+            ("UPDATE song_replicas SET setting = 'verified' WHERE song_id = ? AND IP = ? AND port = ?", verified),
+            ("DELETE FROM song_replicas WHERE song_id = ? AND IP = ? AND port = ?", lost),
+            # a copy the table did not know about counts as a replica of its song
+            ("INSERT OR IGNORE INTO song_replicas (song_id, IP, port, setting) VALUES (?, ?, ?, 'verified')", found),
+        ]
+        if self.execute_many(statements):
+            self.task_log.info(f"Synced {len(buckets)} buckets of {address}: "
+                               f"{len(verified)} verified, {len(lost)} lost, {len(found)} recorded.")
 
-        - Checks for songs in 'verified' status.
-        - If the song exists only on one server, finds a new backup address and starts the backup process.
+    def plan_replication(self, limit=REPLICATION_PLAN_LIMIT):
+        """
+        Queues replication jobs for songs that have fewer replicas than their replication factor.
+        The songs are found through the songs_under_replicated partial index, so a pass costs
+        nothing when every song has its copies. Songs that already have a job queued or running are skipped,
+        and so are songs without a verified replica on an active server, which cannot be copied now and would
+        otherwise take the first rows of every pass. A song whose job was given up is planned again only
+        REPLICATION_RETRY_AFTER seconds later, so a copy that keeps failing does not keep using transfers.
+        Each job copies the song from a verified replica to a server the placement engine chooses,
+        counting the copies planned in the same pass as part of the servers' load.
+        Queued jobs whose source or target server is no longer active are dropped first, so their songs
+        are planned again in the same pass, from another source or to another target.
+
+        :param limit: Most songs planned in one pass.
+        :return: int, number of jobs queued.
         """
         try:
-            songs_verified = self.select("songs", '*', {"setting1": "verified", "setting2": "verified"}, "OR")
-            self.task_log.debug(f"Found {len(songs_verified)} verified songs to consider for backup.")
-            for song in songs_verified:
-                try:
-                    song_id = str(song[0])
-                    setting = ""
-                    if song[5] == "verified" and (song[8] is None or song[8] == ""):
-                        ip1 = song[3]
-                        port1 = song[4]
-                        setting = "setting2"
-                    elif song[8] == "verified" and (song[5] is None or song[5] == ""):
-                        ip1 = song[6]
-                        port1 = song[7]
-                        setting = "setting1"
-
-                    if setting != "":
-                        address = (ip1, int(port1))  # current address of the song
-                        temp = False
-                        while not temp:
-                            address2 = self.find_address()  # new address for backup
-                            if address2 != address:
-                                temp = True
-                        # self.task_log.debug(f"Backing up song {song_id} from {address} to {address2}")
-                        val = self.backup_func(token, token2, song_id, address, address2)
-                        if val:
-                            data = {"ip2": address2[0], "port2": address2[1]}
-                            data[setting] = "pending"
-                            self.update("songs", data, {"id": int(song_id)})
-                except Exception as e:
-                    self.task_log.error(f"Error backing up song {e}")
+            self.cursor.execute("""
+                DELETE FROM replication_jobs
+                WHERE state = 'queued'
+                  AND (NOT EXISTS (SELECT 1 FROM servers WHERE servers.IP = replication_jobs.source_IP
+                                   AND servers.port = replication_jobs.source_port AND servers.setting = 'active')
+                       OR NOT EXISTS (SELECT 1 FROM servers WHERE servers.IP = replication_jobs.target_IP
+                                      AND servers.port = replication_jobs.target_port AND servers.setting = 'active'))
+            """)
+            if self.cursor.rowcount:
+                self.task_log.info(f"Dropped {self.cursor.rowcount} replication jobs of fallen servers, planning again.")
+            self.conn.commit()
+            self.cursor.execute("""
+                SELECT id, replication - replicas FROM songs
+                WHERE replicas < replication
+                  AND NOT EXISTS (SELECT 1 FROM replication_jobs
+                                  WHERE replication_jobs.song_id = songs.id
+                                    AND (state IN ('queued', 'running') OR (state = 'failed' AND failed_at > ?)))
+                  AND EXISTS (SELECT 1 FROM song_replicas
+                              JOIN servers ON servers.IP = song_replicas.IP AND servers.port = song_replicas.port
+                              WHERE song_replicas.song_id = songs.id
+                                AND song_replicas.setting = 'verified' AND servers.setting = 'active')
+                LIMIT ?
+            """, [time.time() - REPLICATION_RETRY_AFTER, limit])
+            songs = self.cursor.fetchall()
+            if not songs:
+                return 0
+            sources = {}
+            for start in range(0, len(songs), SQL_MAX_VARIABLES):
+                sources.update(self._get_replicas([song_id for song_id, missing in songs[start:start + SQL_MAX_VARIABLES]]))
+
+            loads = {load.address: load for load in self.server_loads()}
+            jobs = []
+            for song_id, missing in songs:
+                if song_id not in sources:
+                    continue  # its last usable copy went away since the query
+                source = self.placement.route(sources[song_id])[0]
+                holders = [(ip, int(port)) for ip, port in
+                           self.select("song_replicas", "IP, port", {"song_id": song_id})]
+                for _ in range(missing):
+                    target = self.placement.choose(list(loads.values()), exclude=holders)
+                    if target is None:
+                        break
+                    jobs.append((song_id, source[0], source[1], target[0], target[1]))
+                    holders.append(target)
+                    # the copy counts towards the target's songs, so one pass does not send all copies to one server
+                    loads[target].songs = (loads[target].songs or 0) + 1
+
+            statements = [
+                # jobs given up on more than REPLICATION_RETRY_AFTER seconds ago are replaced by the new ones
+                ("DELETE FROM replication_jobs WHERE song_id = ? AND state = 'failed'",
+                 sorted({(job[0],) for job in jobs})),
+                ("INSERT INTO replication_jobs (song_id, source_IP, source_port, target_IP, target_port, state) "
+                 "VALUES (?, ?, ?, ?, ?, 'queued')", jobs),
+            ]
+            if not self.execute_many(statements):
+                return 0
+            self.task_log.debug(f"Queued {len(jobs)} replication jobs for {len(songs)} under-replicated songs.")
+            return len(jobs)
+
         except Exception as e:
-            err_msg = f"Error during backup_songs process: {e}"
-            self.task_log.error(err_msg)
+            self.task_log.error(f"Error during plan_replication: {e}")
+            return 0
 
-    def backup_func(self, token, token2, song_id, server1, server2):
+    def reset_replication_jobs(self):
         """
-        Sends a backup command to a media server to copy a song from one server to another.
+        Queues again the jobs that were running when the main server stopped, so they are resumed.
+        """
+        self.cursor.execute("UPDATE replication_jobs SET state = 'queued' WHERE state = 'running'")
+        self.conn.commit()
 
-        :param token: Authentication token for the source server
-        :param token2: Authentication token for the destination server
-        :param song_id: ID of the song to be backed up
-        :param server1: Tuple (IP, port) of the source media server where the song currently exists
-        :param server2: Tuple (IP, port) of the target media server for backup
-        :return: True if the backup command was successfully sent, False otherwise
+    def queued_replication_jobs(self, limit, exclude=()):
         """
-        val = False
-        try:
-            media_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            ssl_socket = self.create_ssl_socket(media_socket, server1[0])
-            ssl_socket.connect(server1)
-
-            cmd = "bkg"
-            data = [token, token2, song_id, server2[0], server2[1]]
-            protocol_send(ssl_socket, cmd, data)
-            self.logging_protocol("send", cmd, data)
-            cmd, data = protocol_receive(ssl_socket)
-            self.logging_protocol("recv", cmd, data)
-            ssl_socket.close()
-            val = True
-            self.task_log.info(f"Backup command sent for song ID {song_id} from {server1} to {server2}")
-        except socket.error as e:
-            err_msg = f"Connection failed during backup for song ID {song_id}: {e}"
-            self.task_log.error(err_msg)
-        finally:
-            return val
+        Queued jobs that may start now: their backoff is over and both their servers are active.
+
+        :param limit: Most jobs to return.
+        :param exclude: Addresses (IP, port) of servers that cannot take part in another transfer now;
+                        their jobs are left out.
+        :return: List of (job id, song id, (source IP, port), (target IP, port)), oldest first.
+        """
+        excluded = [f"{ip}:{port}" for ip, port in exclude]
+        placeholders = ", ".join(["?"] * len(excluded))
+        self.cursor.execute(f"""
+            SELECT id, song_id, source_IP, source_port, target_IP, target_port FROM replication_jobs
+            WHERE state = 'queued' AND (not_before IS NULL OR not_before <= ?)
+              AND EXISTS (SELECT 1 FROM servers WHERE servers.IP = replication_jobs.source_IP
+                          AND servers.port = replication_jobs.source_port AND servers.setting = 'active')
+              AND EXISTS (SELECT 1 FROM servers WHERE servers.IP = replication_jobs.target_IP
+                          AND servers.port = replication_jobs.target_port AND servers.setting = 'active')
+              AND source_IP || ':' || source_port NOT IN ({placeholders})
+              AND target_IP || ':' || target_port NOT IN ({placeholders})
+            ORDER BY id LIMIT ?
+        """, [time.time(), *excluded, *excluded, limit])
+        return [(job_id, song_id, (source_ip, int(source_port)), (target_ip, int(target_port)))
+                for job_id, song_id, source_ip, source_port, target_ip, target_port in self.cursor.fetchall()]
+
+    def start_replication_job(self, job_id):
+        """
+        Marks a job as running and counts the attempt.
 
+        :param job_id: ID of the job.
+        """
+        self.cursor.execute("UPDATE replication_jobs SET state = 'running', attempts = attempts + 1 WHERE id = ?",
+                            [job_id])
+        self.conn.commit()
+
+    def finish_replication_job(self, job_id, song_id, target, error=None):
+        """
+        Records the result of a job's transfer. A copy the target server confirmed storing becomes a
+        verified replica and the job is removed. A job a server was too busy for is queued again after
+        REPLICATION_BUSY_DELAY seconds without counting the attempt. Any other failed job is queued again,
+        after a backoff of REPLICATION_BACKOFF seconds doubled with every attempt, until it has used
+        REPLICATION_MAX_ATTEMPTS transfers, and then kept as 'failed' with the time it was given up,
+        which holds the song back from plan_replication for REPLICATION_RETRY_AFTER seconds.
+        If the target server fell meanwhile, plan_replication replaces the queued job with one to another server.
+
+        :param job_id: ID of the job.
+        :param song_id: ID of the song.
+        :param target: Tuple (IP, port) of the server the song was copied to.
+        :param error: None if the transfer succeeded, otherwise the reason it failed.
+        """
+        if error is None:
+            statements = [
+                ("INSERT OR IGNORE INTO song_replicas (song_id, IP, port, setting) VALUES (?, ?, ?, 'verified')",
+                 [(song_id, target[0], target[1])]),
+                ("DELETE FROM replication_jobs WHERE id = ?", [(job_id,)]),
+            ]
+            if self.execute_many(statements):
+                self.task_log.info(f"Song ID {song_id} replicated to {target}")
+            return
+        now = time.time()
+        if error == "busy":
+            self.task_log.debug(f"Replicating song ID {song_id} to {target} postponed, a server is busy")
+            self.cursor.execute("""
+                UPDATE replication_jobs SET state = 'queued', attempts = attempts - 1, not_before = ?
+                WHERE id = ?
+            """, [now + REPLICATION_BUSY_DELAY, job_id])
+            self.conn.commit()
+            return
+        self.task_log.warning(f"Replicating song ID {song_id} to {target} failed: {error}")
+        self.cursor.execute("""
+            UPDATE replication_jobs SET error = ?,
+                   state = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+                   failed_at = CASE WHEN attempts < ? THEN NULL ELSE ? END,
+                   not_before = ? + ? * (1 << (attempts - 1))
+            WHERE id = ?
+        """, [str(error), REPLICATION_MAX_ATTEMPTS, REPLICATION_MAX_ATTEMPTS, now, now, REPLICATION_BACKOFF, job_id])
+        self.conn.commit()
+
+    def set_replication(self, song_id, replication):
+        """
+        Sets how many copies of a song are kept, e.g. more for a popular song, so its reads are spread
+        over more media servers. The replication engine adds the missing copies.
+
+        :param song_id: ID of the song.
+        :param replication: Number of replicas to keep (at least 1).
+        """
+        self.update("songs", {"replication": max(1, int(replication))}, {"id": int(song_id)})
@@ -0,0 +1,128 @@
+import random
+
+MIN_FREE_BYTES = 256 * 1024 * 1024  # a server with less free disk gets no new songs
+# weights of the load score, lower scores are better
+STREAM_WEIGHT = 1.0  # per song being sent or stored right now
+LATENCY_WEIGHT = 1.0  # per 100 ms of probe latency
+SONGS_WEIGHT = 2.0  # for holding twice the average number of songs
+DISK_WEIGHT = 2.0  # for being the fullest server
+
+
+class ServerLoad:
+    """
+    The load of one media server, as last reported by its 'hlo' probe.
+    Values the server did not report yet are None and count as average.
+    """
+    def __init__(self, address, latency=None, free=None, streams=None, songs=None):
+        """
+        :param address: tuple(str, int), address of the server
+        :param latency: float, moving average of the probe round trip in ms
+        :param free: int, free disk bytes in the server's media folder
+        :param streams: int, songs being sent or stored by the server
+        :param songs: int, songs stored on the server
+        """
+        self.address = address
+        self.latency = latency
+        self.free = free
+        self.streams = streams
+        self.songs = songs
+
+    def __repr__(self):
+        return f"ServerLoad({self.address}, latency={self.latency}, free={self.free}, " \
+               f"streams={self.streams}, songs={self.songs})"
+
+
+class PlacementEngine:
+    """
+    Chooses media servers by load instead of at random. Every server gets a weighted score of its
+    active streams, latency, song count and used disk, and a choice is made with power-of-two-choices:
+    two random candidates are compared and the less loaded one wins. Comparing two instead of taking
+    the best keeps servers whose reported load is a little stale from all getting the same songs.
+    """
+    def __init__(self, min_free=MIN_FREE_BYTES, rng=None):
+        """
+        :param min_free: int, free disk bytes a server needs to get new songs
+        :param rng: random.Random, optional, source of the random candidates
+        """
+        self.min_free = min_free
+        self.rng = rng or random.Random()
+
+    def scores(self, servers):
+        """
+        :param servers: list of ServerLoad
+        :return: dict {address: score}, lower is less loaded
+        """
+        def average(values, default):
+            values = [value for value in values if value is not None]
+            return sum(values) / len(values) if values else default
+
+        avg_latency = average([server.latency for server in servers], 0)
+        avg_songs = average([server.songs for server in servers], 0)
+        max_free = max([server.free for server in servers if server.free is not None], default=0)
+        scores = {}
+        for server in servers:
+            latency = avg_latency if server.latency is None else server.latency
+            songs = avg_songs if server.songs is None else server.songs
+            score = STREAM_WEIGHT * (server.streams or 0) + LATENCY_WEIGHT * latency / 100
+            if avg_songs:
+                score += SONGS_WEIGHT * songs / (2 * avg_songs)
+            if max_free and server.free is not None:
+                score += DISK_WEIGHT * (1 - server.free / max_free)
+            scores[server.address] = score
+        return scores
+
+    def rank(self, servers, exclude=()):
+        """
+        :param servers: list of ServerLoad of the usable servers
+        :param exclude: addresses that must not be chosen
+        :return: list of addresses, least loaded first
+        """
+        candidates = [server for server in servers if server.address not in exclude]
+        scores = self.scores(candidates)
+        return sorted(scores, key=scores.get)
+
+    def choose(self, servers, exclude=()):
+        """
+        Chooses a server for a new song.
+
+        :param servers: list of ServerLoad of the usable (active) servers
+        :param exclude: addresses that must not be chosen, e.g. the servers that already hold the song
+        :return: tuple(str, int), address of the chosen server, or None if no server can take the song
+        """
+        candidates = [server for server in servers if server.address not in exclude
+                      and (server.free is None or server.free >= self.min_free)]
+        if not candidates:
+            return None
+        if len(candidates) > 2:
+            candidates = self.rng.sample(candidates, 2)
+        scores = self.scores(candidates)
+        return min(scores, key=scores.get)
+
+    def route(self, servers):
+        """
+        Orders the replicas of a song for a read. The first server is drawn at random, weighted by
+        how lightly loaded each replica is (streams and latency), so the reads of a hot song are spread
+        over all its replicas instead of all going to the least loaded one until the next probe.
+        The other replicas follow, least loaded first, for the client to fail over to.
+
+        :param servers: list of ServerLoad of the active servers holding the song
+        :return: list of addresses, the one to read from first
+        """
+        if len(servers) < 2:
+            return [server.address for server in servers]
+        scores = self.read_scores(servers)
+        addresses = list(scores)
+        first = self.rng.choices(addresses, weights=[1 / (1 + scores[address]) for address in addresses])[0]
+        return [first] + sorted((address for address in addresses if address != first), key=scores.get)
+
+    @staticmethod
+    def read_scores(servers):
+        """
+        :param servers: list of ServerLoad
+        :return: dict {address: score} of the load that matters for reads (streams and latency), lower is better
+        """
+        latencies = [server.latency for server in servers if server.latency is not None]
+        avg_latency = sum(latencies) / len(latencies) if latencies else 0
+        return {server.address: STREAM_WEIGHT * (server.streams or 0)
+                + LATENCY_WEIGHT * (avg_latency if server.latency is None else server.latency) / 100
+                for server in servers}
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from connection_pool import ConnectionPool
+
+REPLICATION_WORKERS = 8  # transfers running at the same time
+MAX_JOBS_PER_SERVER = 2  # transfers a media server takes part in at the same time, as source or target
+GLOBAL_RATE = 64 * 1024 * 1024  # bytes per second of all transfers together
+SERVER_RATE = 32 * 1024 * 1024  # bytes per second of the transfers of one media server
+PLAN_INTERVAL = 15  # seconds between looks for under-replicated songs
+POLL_INTERVAL = 0.5  # seconds between looks for finished transfers and free transfer slots
+TRANSFER_TIMEOUT = 600  # seconds the engine waits for a media server to confirm a copy
+
+
+class ReplicationEngine:
+    """
+    Makes the missing copies of under-replicated songs. Jobs are planned into the replication_jobs table
+    (see MusicDB.plan_replication), so a restart resumes them, and run as concurrent "bkg" transfers.
+    Every transfer carries a rate limit, and a media server takes part in at most max_jobs_per_server
+    transfers, so all transfers together stay under global_rate and each server under server_rate,
+    leaving the rest of the bandwidth (and the media server's download slots) to playback.
+    A job gets the bandwidth that is still free when it starts, so a single job (e.g. repairing one lost
+    server) runs at the full server_rate, and jobs start only while at least a fair share is free.
+    """
+    def __init__(self, db_factory, make_token, workers=REPLICATION_WORKERS, max_jobs_per_server=MAX_JOBS_PER_SERVER,
+                 global_rate=GLOBAL_RATE, server_rate=SERVER_RATE):
+        """
+        :param db_factory: callable returning a new MusicDB; the engine's thread opens its own connection
+        :param make_token: callable(username) returning a fresh JWT token for the media servers
+        :param workers: int, transfers running at the same time
+        :param max_jobs_per_server: int, transfers one media server takes part in at the same time
+        :param global_rate: int, bytes per second of all transfers together
+        :param server_rate: int, bytes per second of the transfers of one media server
+        """
+        self.db_factory = db_factory
+        self.make_token = make_token
+        self.workers = workers
+        self.max_jobs_per_server = max_jobs_per_server
+        self.global_rate = global_rate
+        self.server_rate = server_rate
+        # the least bytes per second a job starts with: its share when every transfer is running
+        self.min_rate = int(min(server_rate / max_jobs_per_server, global_rate / workers))
+        self.pool = None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.running = {}  # future -> (job id, song id, source, target, rate)
+        self.log = logging.getLogger("TaskLogger")
+
+    def start(self):
+        """
+        Starts the engine's thread.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        """
+        The engine's thread loop: records finished transfers, plans new jobs every PLAN_INTERVAL
+        seconds, and starts queued jobs while there are free transfer slots.
+        """
+        db = self.db_factory()
+        self.pool = ConnectionPool(db.context2, timeout=TRANSFER_TIMEOUT)
+        db.reset_replication_jobs()
+        next_plan = 0
+        while True:
+            try:
+                self.collect(db)
+                if time.monotonic() >= next_plan:
+                    db.plan_replication()
+                    next_plan = time.monotonic() + PLAN_INTERVAL
+                self.dispatch(db)
+            except Exception as e:
+                self.log.error(f"Error in replication engine: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    def collect(self, db):
+        """
+        Records the result of every finished transfer in the database.
+        :param db: MusicDB of the engine's thread
+        """
+        for future in [future for future in self.running if future.done()]:
+            job_id, song_id, source, target, rate = self.running.pop(future)
+            try:
+                error = future.result()
+            except Exception as e:
+                error = str(e)
+            db.finish_replication_job(job_id, song_id, target, error)
+
+    def dispatch(self, db):
+        """
+        Starts queued jobs, oldest first, as long as transfers are free. Servers that already take part
+        in max_jobs_per_server transfers, or have less than min_rate of their bandwidth free, are left out
+        of the query, so the jobs of busy servers do not hide the jobs that could run.
+        Every job gets the bandwidth still free on its source, its target and globally when it starts.
+        :param db: MusicDB of the engine's thread
+        """
+        free = self.workers - len(self.running)
+        if free <= 0:
+            return
+        busy = {}  # address -> transfers it takes part in
+        used = {}  # address -> bytes per second of its transfers
+        for job_id, song_id, source, target, rate in self.running.values():
+            for address in (source, target):
+                busy[address] = busy.get(address, 0) + 1
+                used[address] = used.get(address, 0) + rate
+        global_free = self.global_rate - sum(job[4] for job in self.running.values())
+
+        def full(address):
+            return busy.get(address, 0) >= self.max_jobs_per_server or \
+                self.server_rate - used.get(address, 0) < self.min_rate
+
+        exclude = [address for address in busy if full(address)]
+        for job_id, song_id, source, target in db.queued_replication_jobs(free * 4, exclude):
+            if free <= 0 or global_free < self.min_rate:
+                break
+            if full(source) or full(target):
+                continue
+            rate = int(min(global_free, self.server_rate - used.get(source, 0), self.server_rate - used.get(target, 0)))
+            db.start_replication_job(job_id)
+            future = self.executor.submit(self.transfer, song_id, source, target, rate)
+            self.running[future] = (job_id, song_id, source, target, rate)
+            for address in (source, target):
+                busy[address] = busy.get(address, 0) + 1
+                used[address] = used.get(address, 0) + rate
+            global_free -= rate
+            free -= 1
+
+    def transfer(self, song_id, source, target, rate):
+        """
+        Runs on a transfer thread: asks the source server to copy the song to the target server
+        at the job's rate, and waits until the target has stored it.
+        :param song_id: ID of the song
+        :param source: tuple(str, int), address of a server holding the song
+        :param target: tuple(str, int), address of the server to copy it to
+        :param rate: int, bytes per second of the copy
+        :return: None if the copy was stored, otherwise the reason it failed
+        """
+        data = [self.make_token("main_server"), self.make_token("media_server"), str(song_id), target[0], target[1],
+                rate]
+        conn, cmd, data = self.pool.request(source, "bkg", data)
+        if cmd == "error":
+            conn.close()
+        else:
+            self.pool.release(conn)
+        if data and data[0] == "T":
+            return None
+        return data[1] if len(data) > 1 else "no reply"
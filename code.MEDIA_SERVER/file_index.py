@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from digests import DIGEST_BUCKETS, song_bucket, song_hash
+
+HASH_CHUNK_SIZE = 256 * 1024
+REFRESH_INTERVAL = 30  # seconds between rescans of the media folder
+
+
+class FileIndex:
+    """
+    In-memory index of the songs in the media folder: size, modification time and SHA-256 of every song.
+    It is built with one scandir at startup, updated when a song is stored and rescanned periodically,
+    so existence checks, sizes and inventories are answered without touching the disk.
+    It also keeps a digest of the stored songs per bucket of song IDs, updated with every change,
+    so the main server can find out which buckets changed without listing all the songs.
+    """
+    def __init__(self, folder):
+        """
+        :param folder: The media folder; songs are stored in it as <song name>.mp3.
+        """
+        self.folder = folder
+        self.entries = {}  # song name -> (size, mtime_ns, sha256 or None until computed)
+        self.digests = [0] * DIGEST_BUCKETS  # bucket -> XOR of song_hash of its songs
+        self.lock = threading.Lock()
+
+    def path(self, song_name):
+        """
+        :param song_name: Name of the song (without file extension).
+        :return: Path of the song's file.
+        """
+        return os.path.join(self.folder, f"{song_name}.mp3")
+
+    def scan(self):
+        """
+        Reads the media folder with one scandir and brings the index up to date.
+        Songs whose size and modification time did not change keep their checksum.
+
+        :return: Tuple (added, changed, removed) with the number of songs of each kind.
+        """
+        current = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(".mp3") and entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name[:-4]] = (stat.st_size, stat.st_mtime_ns)
+
+        added = changed = 0
+        with self.lock:
+            for song_name, (size, mtime) in current.items():
+                old = self.entries.get(song_name)
+                if old is None:
+                    added += 1
+                elif old[:2] != (size, mtime):
+                    changed += 1
+                else:
+                    continue
+                self._put(song_name, (size, mtime, None))
+            # a song stored while the folder was being read is not in current, but it exists
+            removed = [song_name for song_name in self.entries
+                       if song_name not in current and not os.path.exists(self.path(song_name))]
+            for song_name in removed:
+                self._drop(song_name)
+        return added, changed, len(removed)
+
+    def get(self, song_name):
+        """
+        :param song_name: Name of the song (without file extension).
+        :return: Tuple (size, mtime_ns, sha256 or None) of the song, or None if it is not stored here.
+        """
+        with self.lock:
+            return self.entries.get(song_name)
+
+    def inventory(self):
+        """
+        :return: Dict {song name: (size, sha256 or None)} of all stored songs.
+        """
+        with self.lock:
+            return {song_name: (entry[0], entry[2]) for song_name, entry in self.entries.items()}
+
+    def remove(self, song_name):
+        """
+        Drops a song whose file turned out to be missing.
+
+        :param song_name: Name of the song (without file extension).
+        """
+        with self.lock:
+            self._drop(song_name)
+
+    def update(self, song_name):
+        """
+        Indexes a song that was just stored, with its checksum, which is read while
+        the file is still in the page cache.
+
+        :param song_name: Name of the song (without file extension).
+        :return: str, hex SHA-256 of the song.
+        """
+        with open(self.path(song_name), "rb") as file:
+            return self.checksum(song_name, file)
+
+    def checksum(self, song_name, file=None):
+        """
+        Returns the SHA-256 of a song. It is computed once and kept in the index
+        for as long as the file's size and modification time stay the same.
+
+        :param song_name: Name of the song (without file extension).
+        :param file: Optional open file of the song (binary); its position is not kept.
+        :return: str, hex SHA-256 of the song.
+        :raises FileNotFoundError: If the song is not stored here.
+        """
+        if file is None:
+            with open(self.path(song_name), "rb") as file:
+                return self.checksum(song_name, file)
+
+        checksum = self.known_checksum(song_name, file)
+        if checksum:
+            return checksum
+
+        stat = os.fstat(file.fileno())
+        digest = hashlib.sha256()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        checksum = digest.hexdigest()
+        with self.lock:
+            self._put(song_name, (stat.st_size, stat.st_mtime_ns, checksum))
+        return checksum
+
+    def known_checksum(self, song_name, file):
+        """
+        Returns the SHA-256 of a song only if it is already in the index, without reading the file.
+
+        :param song_name: Name of the song (without file extension).
+        :param file: Open file of the song, whose size and modification time must match the index.
+        :return: str, hex SHA-256 of the song, or None if it is not computed yet.
+        """
+        stat = os.fstat(file.fileno())
+        with self.lock:
+            entry = self.entries.get(song_name)
+        if entry and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            return entry[2]
+        return None
+
+    def _put(self, song_name, entry):
+        """
+        Sets the entry of a song and updates its bucket's digest if the song is new. Call with the lock held.
+        """
+        if song_name not in self.entries:
+            bucket = song_bucket(song_name)
+            if bucket is not None:
+                self.digests[bucket] ^= song_hash(song_name)
+        self.entries[song_name] = entry
+
+    def _drop(self, song_name):
+        """
+        Removes the entry of a song, if any, and updates its bucket's digest. Call with the lock held.
+        """
+        if self.entries.pop(song_name, None) is not None:
+            bucket = song_bucket(song_name)
+            if bucket is not None:
+                self.digests[bucket] ^= song_hash(song_name)
+
+    def digest(self):
+        """
+        :return: List of DIGEST_BUCKETS ints, the digest of every bucket of song IDs.
+        """
+        with self.lock:
+            return list(self.digests)
+
+    def bucket_listing(self, buckets):
+        """
+        Lists the songs of some buckets together with the buckets' digests, taken at the same moment,
+        so a digest always describes the listing sent with it.
+
+        :param buckets: List of bucket numbers.
+        :return: Dict {bucket: (digest, [song names])}.
+        """
+        wanted = set(buckets)
+        with self.lock:
+            listing = {bucket: (self.digests[bucket], []) for bucket in wanted if 0 <= bucket < DIGEST_BUCKETS}
+            for song_name in self.entries:
+                bucket = song_bucket(song_name)
+                if bucket in listing:
+                    listing[bucket][1].append(song_name)
+        return listing
+
+    def refresh(self, interval=REFRESH_INTERVAL):
+        """
+        Background thread loop: computes the checksums that are still missing, starting right away
+        so the checksums of the songs found at startup are ready soon, then rescans the folder every
+        interval seconds, so files added or removed by hand are noticed.
+
+        :param interval: Seconds between rescans.
+        :return: None
+        """
+        while True:
+            try:
+                with self.lock:
+                    missing = [song_name for song_name, entry in self.entries.items() if entry[2] is None]
+                for song_name in missing:
+                    try:
+                        self.checksum(song_name)
+                    except FileNotFoundError:
+                        self.remove(song_name)
+                time.sleep(interval)
+                added, changed, removed = self.scan()
+                if added or changed or removed:
+                    logging.debug(f"File index refreshed: {added} added, {changed} changed, {removed} removed")
+            except OSError as e:
+                logging.debug(f"Error refreshing file index: {e}")
+                time.sleep(interval)
@@ -1,14 +1,28 @@
 import socket
 import os
+import queue
+import selectors
+import time
+import pickle
+import shutil
 import threading
 import jwt
 import logging
-from protocol import protocol_receive, protocol_send
+from protocol import protocol_receive, protocol_send, protocol_send_file, FrameReader, ItemStream, PROTOCOL_VERSION
+from file_index import FileIndex, DIGEST_BUCKETS
 import ssl
 
+UPLOAD_COMMANDS = ("pst", "bkp")  # commands that write a song to disk
+DOWNLOAD_COMMANDS = ("get", "rng", "bkg")  # commands that read a song from disk and send it
+REJECT_QUEUE_LEN = 32  # connections waiting for a "busy" reply when the wait queue is full
+REJECT_TIMEOUT = 2  # seconds a rejected client gets to complete its handshake and send its request
+REJECT_DRAIN_TIME = 10  # seconds the rejecter reads the upload of a rejected request before closing anyway
+
 
 class MediaServer:
-    def __init__(self, ip, port, folder, secret_key, cert_file, key_file, queue_len=1, log_dir='log3', log_file='server.log'):
+    def __init__(self, ip, port, folder, secret_key, cert_file, key_file, queue_len=128, log_dir='log3', log_file='server.log',
+                 handshake_timeout=10, workers=16, wait_queue_len=64, max_uploads=4, max_downloads=8, idle_timeout=30,
+                 max_idle_connections=256):
         """
        Initializes the MediaServer with networking configuration,
        folder for storing songs, SSL settings, and logging.
@@ -19,9 +33,17 @@ class MediaServer:
        :param secret_key: str - Secret key used to verify JWT tokens for client authentication.
        :param cert_file: str - Path to the SSL certificate file (used for secure server connections).
        :param key_file: str - Path to the SSL private key file.
-       :param queue_len: int, optional - Maximum number of queued client connections (default is 1).
+       :param queue_len: int, optional - Accept backlog, the maximum number of queued client connections (default is 128).
        :param log_dir: str, optional - Directory where log files are stored (default is 'logs').
        :param log_file: str, optional - Name of the log file (default is 'server.log').
+       :param handshake_timeout: int, optional - Seconds a client may take to complete the TLS handshake (default is 10).
+       :param workers: int, optional - Number of worker threads that serve connections (default is 16).
+       :param wait_queue_len: int, optional - Accepted connections that may wait for a free worker (default is 64).
+       :param max_uploads: int, optional - Uploads and backups stored at the same time (default is 4).
+       :param max_downloads: int, optional - Songs sent at the same time (default is 8).
+       :param idle_timeout: int, optional - Seconds a keep-alive connection may wait for its next request (default is 30).
+       :param max_idle_connections: int, optional - Keep-alive connections that may wait for their next request
+                                    without holding a worker (default is 256).
 
        :return: None
        """
@@ -30,9 +52,25 @@ class MediaServer:
         self.folder = folder
         self.secret_key = secret_key
         self.queue_len = queue_len
+        self.handshake_timeout = handshake_timeout
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.connections = queue.Queue(maxsize=wait_queue_len)  # (socket, address, FrameReader or None if new)
+        # keep-alive connections between requests wait in the idler's selector, not on a worker
+        self.idle_slots = threading.BoundedSemaphore(max_idle_connections)
+        self.parked = queue.Queue()  # connections handed to the idler, not registered yet
+        self.idle_wake, self.idle_wake_send = socket.socketpair()
+        self.rejects = queue.Queue(maxsize=REJECT_QUEUE_LEN)
+        self.upload_slots = threading.BoundedSemaphore(max_uploads)
+        self.download_slots = threading.BoundedSemaphore(max_downloads)
+        self.active = {self.upload_slots: 0, self.download_slots: 0}  # transfers running now, see load_stats
+        self.active_lock = threading.Lock()
         self.log_dir = log_dir
         self.log_file = os.path.join(log_dir, log_file)
         self._setup_folders()
+        # sizes and checksums of the stored songs, so requests for them do not touch the disk
+        self.index = FileIndex(folder)
+        self.index.scan()
 
         self.CERT_FILE = cert_file
         self.KEY_FILE = key_file
@@ -122,30 +160,37 @@ class MediaServer:
             logging.debug("Invalid token")
             return {"valid": False, "error": "Invalid token"}
 
-    def send_song(self, cmd, client_socket, song_name, token=""):
+    def send_song(self, cmd, client_socket, song_name, token="", version=PROTOCOL_VERSION, rate=None):
         """
         Sends a song file to the client based on the command type.
+        The song is streamed from disk in chunks rather than read into memory.
 
         :param cmd: Command type ('get' or 'bkp').
         :param client_socket: The socket connected to the client.
         :param song_name: Name of the song (without file extension).
         :param token: JWT token (optional, used for backup command).
+        :param version: Protocol version negotiated on the connection.
+        :param rate: Most bytes per second to send the song at (None for as fast as possible).
 
         :return: None
         """
         data = []
+        file = None
         try:
+            if self.index.get(song_name) is None:
+                raise FileNotFoundError(song_name)
             song_path = os.path.join(self.folder, f"{song_name}.mp3")
-            with open(song_path, "rb") as file:
-                song_bytes = file.read()
+            # the file itself is streamed from disk after the other items
+            file = open(song_path, "rb")
 
             if cmd == "bkp":
-                data = [token, song_name, song_bytes]
+                data = [token, song_name]
             elif cmd == "get":
-                data = ["T", song_name + ".mp3", song_bytes]
+                data = ["T", song_name + ".mp3"]
 
         except FileNotFoundError:
             logging.debug("File not found: " + song_name)
+            self.index.remove(song_name)
             data = ["F", "file not found"]
         except OSError as e:
             logging.debug(f"OS error while sending {song_name}: {e}")
@@ -155,59 +200,303 @@ class MediaServer:
             data = ["F", "Unexpected error"]
         finally:
             try:
-                protocol_send(client_socket, cmd, data)
+                if file:
+                    with file:
+                        protocol_send_file(client_socket, cmd, data, file, version, rate=rate)
+                else:
+                    protocol_send(client_socket, cmd, data, version)
                 self.logging_protocol("send", cmd, data)
             except Exception as e:
                 logging.debug(f"Unexpected error while sending {song_name}: {e}")
-            finally:
-                if client_socket and cmd == "get":
-                    logging.debug("close socket with client")
-                    client_socket.close()
+                # a frame cut short leaves the connection unusable
+                client_socket.close()
+
+    def send_range(self, client_socket, song_name, offset, length, version=PROTOCOL_VERSION):
+        """
+        Sends part of a song file, so a client can resume a broken download or seek
+        without fetching the whole file. The reply is ["T", file name, total size, offset, SHA-256, bytes],
+        with the bytes streamed from disk at the offset. The SHA-256 is sent only if the file index
+        already has it, otherwise it is empty, so a reply never waits for the whole file to be hashed.
+
+        :param client_socket: The socket connected to the client.
+        :param song_name: Name of the song (without file extension).
+        :param offset: First byte to send.
+        :param length: Number of bytes to send, 0 for up to the end of the file.
+        :param version: Protocol version negotiated on the connection.
+
+        :return: None
+        """
+        data = []
+        file = None
+        count = 0
+        try:
+            offset, length = int(offset), int(length)
+            if self.index.get(song_name) is None:
+                raise FileNotFoundError(song_name)
+            song_path = os.path.join(self.folder, f"{song_name}.mp3")
+            file = open(song_path, "rb")
+            total = os.fstat(file.fileno()).st_size
+            if offset < 0 or length < 0 or offset > total:
+                file.close()
+                file = None
+                data = ["F", "invalid range"]
+            else:
+                count = total - offset
+                if length:
+                    count = min(length, count)
+                data = ["T", song_name + ".mp3", total, offset, self.index.known_checksum(song_name, file) or ""]
+
+        except ValueError:
+            data = ["F", "invalid range"]
+        except FileNotFoundError:
+            logging.debug("File not found: " + song_name)
+            self.index.remove(song_name)
+            data = ["F", "file not found"]
+        except OSError as e:
+            logging.debug(f"OS error while sending {song_name}: {e}")
+            data = ["F", "OS error"]
+        finally:
+            try:
+                if file:
+                    with file:
+                        protocol_send_file(client_socket, "rng", data, file, version, offset=offset, count=count)
+                else:
+                    protocol_send(client_socket, "rng", data, version)
+                self.logging_protocol("send", "rng", data)
+            except Exception as e:
+                logging.debug(f"Unexpected error while sending {song_name}: {e}")
+                # a frame cut short leaves the connection unusable
+                client_socket.close()
+
+    def verify_batch(self, song_names):
+        """
+        Checks which of many songs are stored here, from the file index alone,
+        so a batch never waits for files to be read.
+
+        :param song_names: List of song names (without file extension).
+
+        :return: Dict {"found": [song names], "lost": [song names]}.
+        """
+        found = []
+        lost = []
+        for song_name in song_names:
+            if self.index.get(song_name) is None:
+                lost.append(song_name)
+            else:
+                found.append(song_name)
+        logging.debug(f"Batch verify: {len(found)} found, {len(lost)} lost")
+        return {"found": found, "lost": lost}
+
+    def backup_song(self, token, song_name, ip, port, rate=None):
+        """
+        Copies a song to another media server with a "bkp" request and waits for it to be stored there.
+
+        :param token: JWT token for the other server.
+        :param song_name: Name of the song (without file extension).
+        :param ip: IP address of the other server.
+        :param port: Port of the other server.
+        :param rate: Most bytes per second to send the song at (None for as fast as possible).
+
+        :return: ["T"] if the other server stored the song, otherwise ["F", reason].
+        """
+        if self.index.get(song_name) is None:
+            return ["F", "file not found"]
+        ssl_s = None
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            ssl_s = self.create_ssl_socket(s, ip)
+            ssl_s.connect((ip, port))
+            self.send_song("bkp", ssl_s, song_name, token, rate=rate)
+            cmd, data = protocol_receive(ssl_s)
+            self.logging_protocol("recv", cmd, data)
+            return ["T"] if data and data[0] == "T" else ["F", data[1] if len(data) > 1 else "backup failed"]
+        except Exception as e:
+            logging.debug(f"Failed to connect to secondary server: {e}")
+            return ["F", "backup failed"]
+        finally:
+            if ssl_s:
+                ssl_s.close()
 
     def add_song(self, song_byte, song_name):
         """
         Saves a song's bytes as an MP3 file in the media folder.
+        The file is written under a temporary name and renamed when complete,
+        so a partial upload is never seen as a stored song.
+        It is added to the file index right away, with its checksum computed while the file
+        is still in the page cache, so verifying the new song does not read it from disk again.
 
-        :param song_byte: Byte content of the song.
+        :param song_byte: Byte content of the song, or an ItemStream that is written to disk as it arrives.
         :param song_name: Name to save the file as (without extension).
 
         :return: True if save succeeded, False otherwise.
         """
+        path = os.path.join(self.folder, f"{song_name}.mp3")
+        temp_path = path + ".part"
         try:
-            path = os.path.join(self.folder, f"{song_name}.mp3")
-            with open(path, 'wb') as file:
-                file.write(song_byte)
+            with open(temp_path, 'wb') as file:
+                if isinstance(song_byte, ItemStream):
+                    song_byte.write_to(file)
+                else:
+                    file.write(song_byte)
+            os.replace(temp_path, path)
+            self.index.update(str(song_name))
             return True
         except Exception as e:
             logging.debug(f"Error saving file: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             return False
 
-    def handle_client(self, client_socket, client_address):
+    def handle_client(self, client_socket, client_address, reader=None):
         """
         Handles an individual client connection, processing commands and
         sending appropriate responses.
+        The connection is kept open for further requests (keep-alive). Whenever it waits for a request,
+        also for the first one, it is handed to the idler, which gives it back to a worker when the request
+        arrives, so an idle connection does not hold a worker. If too many connections are idle already,
+        a new connection waits on the worker for its first request and a keep-alive connection is closed.
 
         :param client_socket: The socket connected to the client.
         :param client_address: Client's address info.
+        :param reader: FrameReader of a keep-alive connection coming back from the idler, None for a new one.
 
         :return: None
         """
-        logging.debug(f"Client connected: {client_address}")
+        ready = reader is not None  # the idler gives a connection back once its next request arrives
+        if reader is None:
+            logging.debug(f"Client connected: {client_address}")
+            reader = FrameReader(client_socket)
+        keep = served = False
         try:
-            cmd, data = protocol_receive(client_socket)
-            if cmd != "hlo":
-                self.logging_protocol("recv", cmd, data)
+            client_socket.settimeout(self.idle_timeout)
+            while True:
+                # a pipelined request that was already received is served right away
+                if not ready and not reader.pending():
+                    if self.park(client_socket, client_address, reader):
+                        keep = True
+                        break
+                    if served:
+                        break
+                ready = False
+                cmd, data = reader.receive(stream=True)
+                if cmd == "error":
+                    logging.debug(f"Connection ended: {data[0]}")
+                    break
+                if cmd != "hlo":
+                    self.logging_protocol("recv", cmd, data)
+
+                if not self.handle_request(client_socket, reader, cmd, data):
+                    break
+                served = True
+
+        except socket.error as e:
+            logging.debug("Socket error: " + str(e))
+        finally:
+            if not keep:
+                client_socket.close()
+                logging.debug("Client disconnected")
+
+    def park(self, client_socket, client_address, reader):
+        """
+        Hands a keep-alive connection that waits for its next request to the idler.
+
+        :param client_socket: The socket connected to the client.
+        :param client_address: Client's address info.
+        :param reader: FrameReader of the connection.
+
+        :return: True if the idler took the connection, False if too many connections are idle already.
+        """
+        if not self.idle_slots.acquire(blocking=False):
+            logging.debug(f"Too many idle connections, {client_address} waits on its worker")
+            return False
+        self.parked.put((client_socket, client_address, reader, time.monotonic() + self.idle_timeout))
+        self.idle_wake_send.send(b"\0")
+        return True
+
+    def idler(self):
+        """
+        Waits, in one selector, for the next request of every idle keep-alive connection, and puts a
+        connection back on the wait queue when it becomes readable. A connection that is idle for
+        idle_timeout seconds, or comes back while the wait queue is full, is closed.
+
+        :return: None
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.idle_wake, selectors.EVENT_READ)
+        idle = {}  # socket -> (address, reader, deadline)
+
+        def release(sock):
+            selector.unregister(sock)
+            self.idle_slots.release()
+            return idle.pop(sock)
+
+        while True:
+            timeout = max(0, min(entry[2] for entry in idle.values()) - time.monotonic()) if idle else None
+            for key, events in selector.select(timeout):
+                if key.fileobj is self.idle_wake:
+                    self.idle_wake.recv(4096)
+                    continue
+                sock = key.fileobj
+                address, reader, deadline = release(sock)
+                try:
+                    self.connections.put_nowait((sock, address, reader))
+                except queue.Full:
+                    logging.debug(f"Server saturated, closing keep-alive connection of {address}")
+                    sock.close()
+
+            while not self.parked.empty():
+                sock, address, reader, deadline = self.parked.get_nowait()
+                try:
+                    selector.register(sock, selectors.EVENT_READ)
+                except (ValueError, OSError) as e:
+                    logging.debug(f"Cannot wait for the next request of {address}: {e}")
+                    self.idle_slots.release()
+                    sock.close()
+                    continue
+                idle[sock] = (address, reader, deadline)
+
+            now = time.monotonic()
+            for sock in [sock for sock, entry in idle.items() if entry[2] <= now]:
+                address = release(sock)[0]
+                logging.debug(f"Keep-alive connection of {address} idle for {self.idle_timeout} s, closing")
+                sock.close()
+
+    def handle_request(self, client_socket, reader, cmd, data):
+        """
+        Handles one request of a client connection.
+
+        :param client_socket: The socket connected to the client.
+        :param reader: FrameReader of the connection.
+        :param cmd: Command of the request.
+        :param data: Data items of the request (a binary last item may still be on the socket).
 
+        :return: True if the connection can carry further requests, False if it should be closed.
+        """
+        slots = None
+        try:
             token = data[0]
             valid = self.verify_token(token)
 
             if not valid["valid"]:
-                protocol_send(client_socket, cmd, ["False", "token is not valid"])
+                protocol_send(client_socket, cmd, ["False", "token is not valid"], reader.version)
                 self.logging_protocol("send", cmd, data)
-                return
+                return False
+
+            slots = self.admit(cmd)
+            if slots is False:
+                # the client sends an upload whole before it reads the reply; closing with its bytes unread
+                # would reset the connection and lose the "busy" reply, so the upload is read and dropped
+                if reader.stream is not None:
+                    reader.stream.discard()
+                protocol_send(client_socket, cmd, ["F", "busy"], reader.version)
+                self.logging_protocol("send", cmd, ["F", "busy"])
+                return True
 
             if cmd == "get":
-                self.send_song("get", client_socket, str(data[1]))
+                self.send_song("get", client_socket, str(data[1]), version=reader.version)
+
+            elif cmd == "rng":
+                self.send_range(client_socket, str(data[1]), data[2], data[3], reader.version)
 
             elif cmd == "pst":
                 is_ok = self.add_song(data[2], str(data[1]))
@@ -215,59 +504,175 @@ class MediaServer:
                     res = ["T", "post song succeeded"]
                 else:
                     res = ["F", "post song failed"]
-                protocol_send(client_socket, cmd, res)
+                protocol_send(client_socket, cmd, res, reader.version)
                 self.logging_protocol("send", cmd, res)
 
             elif cmd == "hlo":
-                res = ["T"]
-                protocol_send(client_socket, cmd, res)
+                res = ["T", pickle.dumps(self.load_stats())]
+                protocol_send(client_socket, cmd, res, reader.version)
                 self.logging_protocol("send", cmd, res)
 
             elif cmd == "vrf":
-                song_path = os.path.join(self.folder, f"{data[1]}.mp3")
-                if os.path.exists(song_path):
+                if self.index.get(str(data[1])) is not None:
                     res = ["T", "found"]
                 else:
                     res = ["F", "lost"]
-                protocol_send(client_socket, cmd, res)
+                protocol_send(client_socket, cmd, res, reader.version)
+                self.logging_protocol("send", cmd, res)
+
+            elif cmd == "vrb":
+                res = ["T", pickle.dumps(self.verify_batch([str(song_name) for song_name in data[1:]]))]
+                protocol_send(client_socket, cmd, res, reader.version)
+                self.logging_protocol("send", cmd, res)
+
+            elif cmd == "dgs":
+                res = ["T", pickle.dumps({"buckets": DIGEST_BUCKETS, "digests": self.index.digest()})]
+                protocol_send(client_socket, cmd, res, reader.version)
+                self.logging_protocol("send", cmd, res)
+
+            elif cmd == "dgl":
+                res = ["T", pickle.dumps(self.index.bucket_listing([int(bucket) for bucket in data[1:]]))]
+                protocol_send(client_socket, cmd, res, reader.version)
                 self.logging_protocol("send", cmd, res)
 
             elif cmd == "bkg":
-                try:
-                    token, song_name, ip, port = data[1], str(data[2]), data[3], int(data[4])
-                    protocol_send(client_socket, cmd, ["T"])
-                    self.logging_protocol("send", cmd, ["T"])
-
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    ssl_s = self.create_ssl_socket(s, ip)
-                    ssl_s.connect((ip, port))
-                    self.send_song("bkp", ssl_s, song_name, token)
-                    cmd, data = protocol_receive(ssl_s)
-                    self.logging_protocol("recv", cmd, data)
-                    ssl_s.close()
-                except Exception as e:
-                    logging.debug(f"Failed to connect to secondary server: {e}")
+                # data[5], if sent, limits the copy to that many bytes per second
+                res = self.backup_song(data[1], str(data[2]), data[3], int(data[4]),
+                                       int(data[5]) if len(data) > 5 and int(data[5]) > 0 else None)
+                protocol_send(client_socket, cmd, res, reader.version)
+                self.logging_protocol("send", cmd, res)
 
             elif cmd == "bkp":
                 result = self.add_song(data[2], str(data[1]))
                 if result:
                     logging.debug("Song uploaded")
-                protocol_send(client_socket, cmd, ["T"])
-                self.logging_protocol("send", cmd, ["T"])
+                res = ["T"] if result else ["F", "store failed"]
+                protocol_send(client_socket, cmd, res, reader.version)
+                self.logging_protocol("send", cmd, res)
+
+            return True
 
-        except socket.error as e:
-            logging.debug("Socket error: " + str(e))
         finally:
+            if slots:
+                with self.active_lock:
+                    self.active[slots] -= 1
+                slots.release()
+
+    def load_stats(self):
+        """
+        Reports the load of the server, sent with every "hlo" reply so the main server can place songs.
+
+        :return: Dict {"free": free disk bytes in the media folder, "streams": songs being sent,
+                 "uploads": songs being stored, "songs": songs stored}.
+        """
+        with self.active_lock:
+            streams, uploads = self.active[self.download_slots], self.active[self.upload_slots]
+        return {"free": shutil.disk_usage(self.folder).free, "streams": streams, "uploads": uploads,
+                "songs": len(self.index.entries)}
+
+    def admit(self, cmd):
+        """
+        Admission control: takes an upload or download slot for the command without waiting.
+
+        :param cmd: The command of the request.
+
+        :return: The semaphore holding the slot (release it when done), None if the command
+                 needs no slot, or False if all slots of its kind are taken.
+        """
+        if cmd in UPLOAD_COMMANDS:
+            slots = self.upload_slots
+        elif cmd in DOWNLOAD_COMMANDS:
+            slots = self.download_slots
+        else:
+            return None
+        if not slots.acquire(blocking=False):
+            logging.debug(f"No free slot for {cmd}, answering busy")
+            return False
+        with self.active_lock:
+            self.active[slots] += 1
+        return slots
+
+    def worker(self):
+        """
+        Worker thread loop: serves accepted connections from the wait queue one at a time.
+
+        :return: None
+        """
+        while True:
+            client_socket, client_address, reader = self.connections.get()
+            try:
+                if reader is None:
+                    self.handshake_and_handle(client_socket, client_address)
+                else:
+                    self.handle_client(client_socket, client_address, reader)
+            except Exception as e:
+                logging.debug(f"Error handling connection from {client_address}: {e}")
+
+    def rejecter(self):
+        """
+        Answers connections that found the wait queue full with a "busy" reply,
+        so the client can retry later or try another server instead of waiting.
+
+        :return: None
+        """
+        while True:
+            client_socket, client_address = self.rejects.get()
+            try:
+                client_socket.settimeout(REJECT_TIMEOUT)
+                ssl_socket = self.context.wrap_socket(client_socket, server_side=True)
+                reader = FrameReader(ssl_socket)
+                cmd, data = reader.receive(stream=True)
+                if cmd != "error":
+                    protocol_send(ssl_socket, cmd, ["F", "busy"], reader.version)
+                    self.logging_protocol("send", cmd, ["F", "busy"])
+                    # read the rest of an upload before closing, so the close does not reset the
+                    # connection before the client has read the reply
+                    deadline = time.monotonic() + REJECT_DRAIN_TIME
+                    if reader.stream is not None:
+                        for _ in reader.stream.chunks():
+                            if time.monotonic() > deadline:
+                                break
+                ssl_socket.close()
+            except (socket.timeout, ssl.SSLError, OSError) as e:
+                logging.debug(f"Failed to answer busy to {client_address}: {e}")
+                client_socket.close()
+
+    def handshake_and_handle(self, client_socket, client_address):
+        """
+        Runs on a worker thread: completes the TLS handshake with a timeout,
+        so a slow client never holds up the accept loop, then handles the client.
+
+        :param client_socket: The plain accepted socket.
+        :param client_address: Client's address info.
+
+        :return: None
+        """
+        try:
+            client_socket.settimeout(self.handshake_timeout)
+            ssl_socket = self.context.wrap_socket(client_socket, server_side=True)
+            ssl_socket.settimeout(None)
+        except (socket.timeout, ssl.SSLError, OSError) as e:
+            logging.debug(f"TLS handshake with {client_address} failed: {e}")
             client_socket.close()
-            logging.debug("Client disconnected")
+            return
+        self.handle_client(ssl_socket, client_address)
 
     def start(self):
         """
         Starts the media server, listens for incoming connections,
-        and spawns a new thread to handle each client.
+        and hands each one to a fixed pool of worker threads through a bounded wait queue.
+        The accept loop only accepts; the TLS handshake runs on the worker.
+        When the wait queue is full, the connection gets a "busy" reply instead,
+        or is closed if even the reject queue is full.
 
         :return: None
         """
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+        threading.Thread(target=self.index.refresh, daemon=True).start()
+        threading.Thread(target=self.rejecter, daemon=True).start()
+        threading.Thread(target=self.idler, daemon=True).start()
+
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             try:
                 s.bind((self.ip, self.port))
@@ -276,8 +681,14 @@ class MediaServer:
                 while True:
                     try:
                         client_socket, client_addr = s.accept()
-                        ssl_socket = self.context.wrap_socket(client_socket, server_side=True)
-                        threading.Thread(target=self.handle_client, args=(ssl_socket, client_addr)).start()
+                        try:
+                            self.connections.put_nowait((client_socket, client_addr, None))
+                        except queue.Full:
+                            try:
+                                self.rejects.put_nowait((client_socket, client_addr))
+                            except queue.Full:
+                                logging.debug(f"Server saturated, dropping connection from {client_addr}")
+                                client_socket.close()
                     except Exception as e:
                         logging.debug(f"Error accepting or handling connection: {e}")
                         break
@@ -293,7 +704,7 @@ if __name__ == "__main__":
         secret_key="my_secret_key",
         cert_file="certificate.crt",
         key_file="privateKey.key",
-        queue_len=1,
+        queue_len=128,
         log_dir="log3",
         log_file="server.log"
     )
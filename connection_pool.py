@@ -0,0 +1,183 @@
+import select
+import socket
+import threading
+import time
+from protocol import FrameReader, protocol_send
+
+# idle connections kept per address; a media server keeps up to max_idle_connections idle connections
+# of all its clients together, so clients * POOL_MAX_IDLE should stay below that
+POOL_MAX_IDLE = 2
+POOL_IDLE_TIMEOUT = 20  # seconds an idle connection is kept, less than the media server's idle timeout
+
+
+class PooledConnection:
+    """
+    A TLS connection taken from a ConnectionPool, with the FrameReader that must read all its frames.
+    """
+    def __init__(self, address, ssl_socket, reused):
+        """
+        :param address: tuple(str, int), address of the server
+        :param ssl_socket: ssl.SSLSocket, the connected socket
+        :param reused: bool, True if the connection already carried earlier requests
+        """
+        self.address = address
+        self.sock = ssl_socket
+        self.reader = FrameReader(ssl_socket)
+        self.reused = reused
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """
+        Closes the connection; it is not returned to the pool.
+        """
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """
+    Keeps TLS connections to servers open between requests, keyed by (ip, port).
+    A new connection to a known server resumes its last TLS session (ssl.SSLSession),
+    which skips the certificate exchange and most of the handshake work.
+    """
+    def __init__(self, context, timeout=5, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT):
+        """
+        :param context: ssl.SSLContext, client context used for every connection
+        :param timeout: float, socket timeout of the connections in seconds
+        :param max_idle: int, idle connections kept per address
+        :param idle_timeout: float, seconds after which an idle connection is closed instead of reused
+        """
+        self.context = context
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = {}  # (ip, port) -> list of idle PooledConnection, most recent last
+        self.sessions = {}  # (ip, port) -> ssl.SSLSession of the last connection
+        self.lock = threading.Lock()
+        self.handshakes = 0  # TLS handshakes done
+        self.resumed = 0  # handshakes that resumed a session
+        self.reuses = 0  # requests sent on an already open connection
+
+    def connect(self, address):
+        """
+        Opens a new connection, resuming the last TLS session with the server when there is one.
+        :param address: tuple(str, int), address of the server
+        :return: PooledConnection
+        """
+        with self.lock:
+            session = self.sessions.get(address)
+        plain_socket = socket.create_connection(address, self.timeout)
+        try:
+            ssl_socket = self.context.wrap_socket(plain_socket, server_hostname=address[0], session=session)
+        except Exception:
+            plain_socket.close()
+            raise
+        with self.lock:
+            self.handshakes += 1
+            if ssl_socket.session_reused:
+                self.resumed += 1
+        return PooledConnection(address, ssl_socket, reused=False)
+
+    def acquire(self, address):
+        """
+        Returns an idle connection to the server, or a new one.
+        Idle connections that timed out or were closed by the server are dropped.
+        :param address: tuple(str, int), address of the server
+        :return: PooledConnection
+        """
+        while True:
+            with self.lock:
+                connections = self.idle.get(address)
+                conn = connections.pop() if connections else None
+            if conn is None:
+                return self.connect(address)
+            if time.monotonic() - conn.last_used > self.idle_timeout or self._closed_by_server(conn):
+                conn.close()
+                continue
+            conn.reused = True
+            with self.lock:
+                self.reuses += 1
+            return conn
+
+    @staticmethod
+    def _closed_by_server(conn):
+        """
+        An idle connection has nothing to read unless the server closed it.
+        :param conn: PooledConnection
+        :return: bool, True if the connection must not be used
+        """
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+            return bool(readable) or conn.sock.pending() > 0
+        except (OSError, ValueError):
+            return True
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool after its reply was read completely.
+        A connection with an unread item left on it is closed instead.
+        :param conn: PooledConnection
+        """
+        stream = conn.reader.stream
+        if stream is not None and stream.remaining:
+            conn.close()
+            return
+        conn.last_used = time.monotonic()
+        with self.lock:
+            try:
+                # with TLS 1.3 the session ticket arrives after the handshake, so it is taken here
+                if conn.sock.session is not None:
+                    self.sessions[conn.address] = conn.sock.session
+            except (OSError, ValueError):
+                pass
+            connections = self.idle.setdefault(conn.address, [])
+            if len(connections) < self.max_idle:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def request(self, address, cmd, data, stream=False):
+        """
+        Sends a request and receives its reply on a pooled connection. A request that fails on
+        a reused connection because the server had closed it (the send fails, or the connection ends
+        before any byte of the reply) is sent again once on a new one. A timeout is never retried:
+        the server got the request and may still be working on it, and some requests (pst, bkg)
+        must not run twice.
+        The caller releases the connection when done with the reply, or closes it on failure.
+        :param address: tuple(str, int), address of the server
+        :param cmd: str, command of the request
+        :param data: list, data items of the request
+        :param stream: bool, leave a binary last item of the reply on the socket (see FrameReader.receive)
+        :return: tuple, (PooledConnection, reply cmd, reply data)
+        """
+        conn = self.acquire(address)
+        try:
+            protocol_send(conn.sock, cmd, data)
+        except OSError:
+            if not conn.reused:
+                conn.close()
+                raise
+            retry = True
+        else:
+            received = conn.reader.received
+            reply_cmd, reply_data = conn.reader.receive(stream)
+            retry = reply_cmd == "error" and conn.reused and reply_data != ["timeout"] \
+                and conn.reader.received == received
+        if retry:
+            conn.close()
+            conn = self.connect(address)
+            protocol_send(conn.sock, cmd, data)
+            reply_cmd, reply_data = conn.reader.receive(stream)
+        return conn, reply_cmd, reply_data
+
+    def close_all(self):
+        """
+        Closes all idle connections.
+        """
+        with self.lock:
+            connections = [conn for idle in self.idle.values() for conn in idle]
+            self.idle.clear()
+        for conn in connections:
+            conn.close()
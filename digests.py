@@ -0,0 +1,40 @@
+import hashlib
+
+DIGEST_BUCKETS = 256  # songs are split by song ID modulo this into buckets with one digest each
+
+
+def song_bucket(song_name, buckets=DIGEST_BUCKETS):
+    """
+    :param song_name: Name of the song (its song ID).
+    :param buckets: Number of digest buckets.
+    :return: int, digest bucket of the song, or None if the name is not a song ID.
+    """
+    try:
+        return int(song_name) % buckets
+    except ValueError:
+        return None
+
+
+def song_hash(song_name):
+    """
+    :param song_name: Name of the song.
+    :return: int, 64-bit hash of the name; a bucket's digest is the XOR of the hashes of its songs.
+    """
+    return int.from_bytes(hashlib.sha256(song_name.encode()).digest()[:8], "big")
+
+
+def bucket_digests(song_names, buckets=DIGEST_BUCKETS):
+    """
+    Computes the bucket digests of a set of songs the same way a media server's file index keeps them,
+    so the main server can compare what a server should hold with what it reports.
+
+    :param song_names: Iterable of song names (song IDs as strings).
+    :param buckets: Number of digest buckets.
+    :return: List of buckets ints, the digest of every bucket.
+    """
+    digests = [0] * buckets
+    for song_name in song_names:
+        bucket = song_bucket(song_name, buckets)
+        if bucket is not None:
+            digests[bucket] ^= song_hash(song_name)
+    return digests
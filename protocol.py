@@ -2,6 +2,10 @@ import socket
 import ssl
 import logging
 import os
+import codecs
+import asyncio
+import struct
+import time
 
 LOG_FORMAT = '%(levelname)s | %(asctime)s | %(message)s'
 LOG_LEVEL = logging.DEBUG
@@ -11,36 +15,201 @@ LOG_FILE = os.path.join(LOG_DIR, 'protocol.log')
  #   os.makedirs(LOG_DIR)
 #logging.basicConfig(format=LOG_FORMAT, filename=LOG_FILE, level=LOG_LEVEL)
 
+RECV_BUFFER_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
 
-def protocol_send(my_socket, cmd, data):
+# v2 frame: HEADER, then num_of_items ITEM_ENTRY records, then the items.
+# The body length in the header covers the item table and the items.
+PROTOCOL_VERSION = 2
+FRAME_MAGIC = b"\xf5\x4d"  # never the first bytes of a v1 frame, which starts with an ASCII command
+HEADER = struct.Struct("!2sB3sHIQ")  # magic, version, command, item count, request ID, body length
+ITEM_ENTRY = struct.Struct("!cQ")  # type sign, item length in bytes
+
+COALESCE_LIMIT = 16 * 1024  # smaller parts are joined into one segment before sending
+SEND_CHUNK_SIZE = 256 * 1024
+SENDMSG_MAX_SEGMENTS = 64  # stays well below IOV_MAX
+
+
+def protocol_send(my_socket, cmd, data, version=PROTOCOL_VERSION, request_id=0):
     """
     Sends a command and associated data to a socket using a custom protocol.
+    The frame is sent as a list of segments, so large items are never copied into one message.
     :param my_socket: socket, the socket to send the data through
     :param cmd: str, a 3-character command indicating the request type
     :param data: list, a list of strings or bytes objects to send
+    :param version: int, frame format to use (1 = ASCII lengths, 2 = binary header)
+    :param request_id: int, ID matching a reply to its request (v2 only, 0 = not pipelined)
     :return: None, raises exceptions on timeout or SSL error
     """
     try:
-        msg = cmd + str(len(data))
-        msg = msg.encode()
-        for i in data:
-            if isinstance(i, bytes):
-                sign = 'b'
-                encoded_data = i
-                i_length = str(len(i))
-                logging.debug("sending bytes")
-                logging.debug(len(encoded_data))
+        if version == 1:
+            segments = frame_segments_v1(cmd, data)
+        else:
+            segments = frame_segments_v2(cmd, data, request_id)
+        send_segments(my_socket, segments)
+
+        print("sent_succe")
+    except socket.timeout:
+        print("Timeout occurred while waiting for response")
+        raise
+
+    except ssl.SSLError as e:
+        print(f"SSL error: {e}")
+        raise
+
+
+def is_binary(item):
+    """
+    :param item: a data item of a frame
+    :return: bool, True if the item is sent as a 'b' item
+    """
+    return isinstance(item, (bytes, bytearray, memoryview))
+
+
+def coalesce(parts):
+    """
+    Joins runs of small parts into one segment and keeps large parts as memoryviews,
+    so a frame is sent in few segments without copying its large items.
+    :param parts: list, bytes-like parts in frame order
+    :return: list, segments to send
+    """
+    segments = []
+    pending = bytearray()
+    for part in parts:
+        if len(part) < COALESCE_LIMIT:
+            pending += part
+        else:
+            if pending:
+                segments.append(pending)
+                pending = bytearray()
+            segments.append(memoryview(part).cast("B"))
+    if pending:
+        segments.append(pending)
+    return segments
+
+
+def frame_segments_v1(cmd, data, file_size=None):
+    """
+    Builds a v1 frame: command, one ASCII digit item count, then for every item
+    its type sign, its length in ASCII digits ended by '!' and the item itself.
+    :param cmd: str, a 3-character command
+    :param data: list, strings or bytes objects (at most 9 items)
+    :param file_size: int, optional, announces one more binary item of this length after data,
+                      whose bytes the caller sends after the returned segments
+    :return: list, the frame as segments
+    """
+    num_of_items = len(data) + (file_size is not None)
+    if num_of_items > 9:
+        raise ValueError("v1 frames can carry at most 9 items")
+    parts = [(cmd + str(num_of_items)).encode()]
+    for i in data:
+        if is_binary(i):
+            sign = 'b'
+            encoded_data = i
+            i_length = str(memoryview(i).nbytes)
+            logging.debug("sending bytes")
+            logging.debug(i_length)
+        else:
+            i = str(i)
+            sign = 's'
+            i_length = str(len(i))
+            encoded_data = i.encode()
+
+        parts.append((sign + i_length + "!").encode())
+        parts.append(encoded_data)
+    if file_size is not None:
+        parts.append(("b" + str(file_size) + "!").encode())
+    return coalesce(parts)
+
+
+def frame_segments_v2(cmd, data, request_id=0, file_size=None):
+    """
+    Builds a v2 frame: a fixed binary header, a packed table with the type sign and
+    byte length of every item, and the items themselves.
+    :param cmd: str, a 3-character command
+    :param data: list, strings or bytes objects
+    :param request_id: int, ID of the request the frame belongs to
+    :param file_size: int, optional, announces one more binary item of this length after data,
+                      whose bytes the caller sends after the returned segments
+    :return: list, the frame as segments
+    """
+    items = []
+    table = bytearray()
+    for i in data:
+        if is_binary(i):
+            sign = b'b'
+        else:
+            sign = b's'
+            i = str(i).encode()
+        i_length = memoryview(i).nbytes
+        table += ITEM_ENTRY.pack(sign, i_length)
+        items.append(i)
+    body_length = len(table) + sum(memoryview(i).nbytes for i in items)
+    num_of_items = len(items)
+    if file_size is not None:
+        table += ITEM_ENTRY.pack(b'b', file_size)
+        body_length += ITEM_ENTRY.size + file_size
+        num_of_items += 1
+    header = HEADER.pack(FRAME_MAGIC, 2, cmd.encode(), num_of_items, request_id, body_length)
+    return coalesce([header, table, *items])
+
+
+def send_segments(my_socket, segments):
+    """
+    Sends all segments in order, retrying short writes until the whole frame is out.
+    Plain sockets use sendmsg (scatter/gather); SSL sockets, which do not support it,
+    send each segment in chunks with sendall.
+    :param my_socket: socket, the socket to send through
+    :param segments: list, bytes-like segments
+    :return: None
+    """
+    if isinstance(my_socket, ssl.SSLSocket) or not hasattr(my_socket, "sendmsg"):
+        for segment in segments:
+            view = memoryview(segment)
+            for offset in range(0, len(view), SEND_CHUNK_SIZE):
+                my_socket.sendall(view[offset:offset + SEND_CHUNK_SIZE])
+        return
+
+    views = [memoryview(segment) for segment in segments if len(segment)]
+    index = 0
+    while index < len(views):
+        sent = my_socket.sendmsg(views[index:index + SENDMSG_MAX_SEGMENTS])
+        while sent:
+            if sent >= len(views[index]):
+                sent -= len(views[index])
+                index += 1
             else:
-                i = str(i)
-                sign = 's'
-                i_length = str(len(i))
-                encoded_data = str(i).encode()
+                views[index] = views[index][sent:]
+                sent = 0
 
-            temp = sign + i_length + "!"
-            msg += temp.encode() + encoded_data
-        my_socket.send(msg)
 
-        #print(msg[20])
+def protocol_send_file(my_socket, cmd, data, file, version=PROTOCOL_VERSION, request_id=0, offset=0, count=None,
+                       rate=None):
+    """
+    Sends a frame whose last item is the content of an open file, streamed from disk:
+    the header goes out first and the file follows in chunks, so memory use stays
+    constant and the receiver sees the first bytes right away whatever the file size.
+    :param my_socket: socket, the socket to send the data through
+    :param cmd: str, a 3-character command indicating the request type
+    :param data: list, the items before the file (strings or bytes objects)
+    :param file: file object opened in binary mode
+    :param version: int, frame format to use (1 = ASCII lengths, 2 = binary header)
+    :param request_id: int, ID matching a reply to its request (v2 only, 0 = not pipelined)
+    :param offset: int, position in the file of the first byte to send
+    :param count: int, number of bytes to send (None = up to the end of the file)
+    :param rate: int, optional, most bytes per second to send the file at (None = as fast as possible)
+    :return: None, raises exceptions on timeout or SSL error
+    """
+    try:
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+        if version == 1:
+            segments = frame_segments_v1(cmd, data, count)
+        else:
+            segments = frame_segments_v2(cmd, data, request_id, count)
+        send_segments(my_socket, segments)
+        send_file_body(my_socket, file, offset, count, rate)
+
         print("sent_succe")
     except socket.timeout:
         print("Timeout occurred while waiting for response")
@@ -51,19 +220,111 @@ def protocol_send(my_socket, cmd, data):
         raise
 
 
+def send_file_body(my_socket, file, offset, count, rate=None):
+    """
+    Sends count bytes of a file starting at offset.
+    Plain sockets use socket.sendfile, which hands the copy to the kernel (os.sendfile)
+    where the platform allows it; SSL sockets, whose data must be encrypted in user space,
+    read the file into one reused buffer and send it chunk by chunk with sendall.
+    With a rate, the file is sent chunk by chunk and paced, so that it never gets ahead of rate bytes per second.
+    :param my_socket: socket, the socket to send through
+    :param file: file object opened in binary mode
+    :param offset: int, position in the file of the first byte to send
+    :param count: int, number of bytes to send
+    :param rate: int, optional, most bytes per second (None = as fast as possible)
+    :return: None
+    """
+    if not rate and not isinstance(my_socket, ssl.SSLSocket):
+        sent = my_socket.sendfile(file, offset, count)
+        if sent != count:
+            raise EOFError(f"file ended after {sent} of {count} bytes")
+        return
+
+    file.seek(offset)
+    buffer = bytearray(min(SEND_CHUNK_SIZE, count) or 1)
+    view = memoryview(buffer)
+    remaining = count
+    start = time.monotonic()
+    while remaining:
+        n = file.readinto(view[:min(remaining, len(buffer))])
+        if not n:
+            raise EOFError(f"file ended after {count - remaining} of {count} bytes")
+        my_socket.sendall(view[:n])
+        remaining -= n
+        if rate:
+            ahead = (count - remaining) / rate - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def decode_items_v2(table, body):
+    """
+    Splits the body of a v2 frame into its items according to the item table.
+    :param table: bytes, the packed item table
+    :param body: bytes, the items following the table
+    :return: list, the decoded items (str for 's' items, bytes for 'b' items)
+    """
+    data = []
+    offset = 0
+    for sign, i_length in ITEM_ENTRY.iter_unpack(table):
+        item = body[offset:offset + i_length]
+        offset += i_length
+        if sign == b'b':
+            data.append(bytes(item))
+        elif sign == b's':
+            data.append(bytes(item).decode())
+    return data
+
+
+def parse_header(header):
+    """
+    Unpacks and checks a v2 frame header.
+    :param header: bytes, HEADER.size bytes
+    :return: tuple, (cmd: str, num_of_items: int, request_id: int, body_length: int)
+    """
+    magic, version, cmd, num_of_items, request_id, body_length = HEADER.unpack(header)
+    if magic != FRAME_MAGIC or version != 2:
+        raise ValueError(f"unsupported frame version {version}")
+    if body_length < num_of_items * ITEM_ENTRY.size:
+        raise ValueError("frame body shorter than its item table")
+    return cmd.decode(), num_of_items, request_id, body_length
+
+
+def recv_exact(my_socket, length):
+    """
+    Receives exactly length bytes with recv_into.
+    :param my_socket: socket, the socket to receive from
+    :param length: int, number of bytes to receive
+    :return: bytearray
+    """
+    data = bytearray(length)
+    view = memoryview(data)
+    received = 0
+    while received < length:
+        count = my_socket.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed while receiving data")
+        received += count
+    return data
+
+
 def protocol_receive(my_socket):
     """
     Receives a command and associated data from a socket using a custom protocol.
+    Both v1 and v2 frames are accepted; v2 frames start with FRAME_MAGIC.
     :param my_socket: socket, the socket to receive the data from
     :return: tuple, (cmd: str, data: list) on success, or ("error", [error_message]) on failure
     """
     try:
-        cmd = ""
-        while len(cmd) < 3:
-            b = my_socket.recv(1).decode()
-            if b:
-                cmd += b
+        first = bytes(recv_exact(my_socket, 3))
+        if first[:2] == FRAME_MAGIC:
+            header = first + recv_exact(my_socket, HEADER.size - 3)
+            cmd, num_of_items, _, body_length = parse_header(header)
+            body = recv_exact(my_socket, body_length)
+            table_size = num_of_items * ITEM_ENTRY.size
+            return cmd, decode_items_v2(body[:table_size], memoryview(body)[table_size:])
 
+        cmd = first.decode()
         num_of_items = my_socket.recv(1).decode()
         data = []
         num_of_items = int(num_of_items)
@@ -75,10 +336,7 @@ def protocol_receive(my_socket):
                 i_length += b
                 b = my_socket.recv(1).decode()
             if sign == 'b':
-                item = b''
-                while len(item) < int(i_length):
-                    item += my_socket.recv(int(i_length) - len(item))
-                data.append(item)
+                data.append(bytes(recv_exact(my_socket, int(i_length))))
             elif sign == 's':
                 item = ''
                 for j in range(int(i_length)):
@@ -100,6 +358,431 @@ def protocol_receive(my_socket):
         return "error", [str(e)]
 
 
+class FrameReader:
+    """
+    Buffered reader that parses whole protocol frames from one socket.
+
+    The socket is read in large chunks into a reusable buffer and frames are parsed
+    from that buffer, instead of issuing a recv() call per header byte or character.
+    A reader may hold bytes of the next frame, so a connection must keep using the
+    same reader for every frame it receives.
+
+    The version of the first frame fixes the protocol version of the connection;
+    it is kept in self.version so replies can be sent in the same format.
+    The request ID of the last frame is kept in self.request_id, so pipelined
+    replies can be matched to their requests.
+    """
+    def __init__(self, my_socket, buffer_size=RECV_BUFFER_SIZE):
+        """
+        :param my_socket: socket, the (SSL) socket to read frames from
+        :param buffer_size: int, size of the reusable receive buffer in bytes
+        """
+        self.my_socket = my_socket
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first unread byte in the buffer
+        self.end = 0  # end of the valid data in the buffer
+        self.version = None  # negotiated on the first frame
+        self.stream = None  # ItemStream of the last frame, if it was received in stream mode
+        self.request_id = 0  # request ID of the last frame, 0 for v1 frames
+        self.received = 0  # bytes read from the socket so far
+
+    def _fill(self):
+        """
+        Reads the next chunk from the socket into the free part of the buffer.
+        Unread bytes are moved to the front of the buffer when it runs out of space.
+
+        :return: None, raises ConnectionError if the peer closed the connection
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            remaining = self.end - self.start
+            self.buffer[:remaining] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, remaining
+        count = self.my_socket.recv_into(self.view[self.end:])
+        if not count:
+            raise ConnectionError("Connection closed while receiving data")
+        self.received += count
+        self.end += count
+
+    def _read_exact(self, length):
+        """
+        Reads exactly length bytes. Large items are received straight into their
+        own bytearray, without passing through the buffer.
+
+        :param length: int, number of bytes to read
+        :return: bytes
+        """
+        while self.end - self.start < length and self.end - self.start < len(self.buffer) // 2:
+            self._fill()
+        if self.end - self.start >= length:
+            item = bytes(self.view[self.start:self.start + length])
+            self.start += length
+            return item
+
+        item = bytearray(length)
+        item_view = memoryview(item)
+        received = self.end - self.start
+        item_view[:received] = self.view[self.start:self.end]
+        self.start = self.end = 0
+        while received < length:
+            count = self.my_socket.recv_into(item_view[received:])
+            if not count:
+                raise ConnectionError("Connection closed while receiving data")
+            self.received += count
+            received += count
+        return bytes(item)
+
+    def _readinto(self, view):
+        """
+        Reads up to len(view) bytes into view, from the buffer first and then the socket.
+
+        :param view: memoryview, writable destination
+        :return: int, number of bytes read
+        """
+        available = self.end - self.start
+        if available:
+            count = min(available, len(view))
+            view[:count] = self.view[self.start:self.start + count]
+            self.start += count
+            return count
+        count = self.my_socket.recv_into(view)
+        if not count:
+            raise ConnectionError("Connection closed while receiving data")
+        self.received += count
+        return count
+
+    def _peek(self, length):
+        """
+        Returns the next length bytes without consuming them.
+
+        :param length: int, number of bytes to look at (must fit in the buffer)
+        :return: bytes
+        """
+        while self.end - self.start < length:
+            self._fill()
+        return bytes(self.view[self.start:self.start + length])
+
+    def _read_until(self, delimiter):
+        """
+        Reads bytes up to a delimiter. The delimiter is consumed but not returned.
+
+        :param delimiter: bytes, a single byte delimiter
+        :return: bytes
+        """
+        while True:
+            index = self.buffer.find(delimiter, self.start, self.end)
+            if index != -1:
+                item = bytes(self.view[self.start:index])
+                self.start = index + 1
+                return item
+            self._fill()
+
+    def _read_text(self, length):
+        """
+        Reads a string item of length characters, decoding UTF-8 as it goes.
+
+        :param length: int, number of characters in the item
+        :return: str
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        item = decoder.decode(self._read_exact(length))
+        while len(item) < length:
+            # every character takes at least one byte, so this never reads past the item
+            item += decoder.decode(self._read_exact(length - len(item)))
+        return item
+
+    def _binary_item(self, i_length, last, stream):
+        """
+        Reads a binary item, or leaves it on the socket as an ItemStream.
+
+        :param i_length: int, item length in bytes
+        :param last: bool, True for the last item of the frame
+        :param stream: bool, True if the caller asked for stream mode
+        :return: bytes or ItemStream
+        """
+        if stream and last:
+            self.stream = ItemStream(self, i_length)
+            return self.stream
+        return self._read_exact(i_length)
+
+    def _receive_v1(self, stream):
+        """
+        Parses a v1 frame from the buffer.
+        :param stream: bool, return a final binary item as an ItemStream
+        :return: tuple, (cmd: str, data: list)
+        """
+        self.request_id = 0
+        cmd = self._read_exact(3).decode()
+        num_of_items = int(self._read_exact(1).decode())
+        data = []
+        for i in range(num_of_items):
+            sign = self._read_exact(1).decode()
+            i_length = int(self._read_until(b"!").decode())
+            if sign == 'b':
+                data.append(self._binary_item(i_length, i == num_of_items - 1, stream))
+            elif sign == 's':
+                data.append(self._read_text(i_length))
+        return cmd, data
+
+    def _receive_v2(self, stream):
+        """
+        Parses a v2 frame from the buffer.
+        :param stream: bool, return a final binary item as an ItemStream
+        :return: tuple, (cmd: str, data: list)
+        """
+        cmd, num_of_items, self.request_id, body_length = parse_header(self._read_exact(HEADER.size))
+        table = self._read_exact(num_of_items * ITEM_ENTRY.size)
+        if sum(i_length for _, i_length in ITEM_ENTRY.iter_unpack(table)) != body_length - len(table):
+            raise ValueError("item lengths do not match the frame body length")
+        data = []
+        for i, (sign, i_length) in enumerate(ITEM_ENTRY.iter_unpack(table)):
+            if sign == b'b':
+                data.append(self._binary_item(i_length, i == num_of_items - 1, stream))
+            elif sign == b's':
+                data.append(self._read_exact(i_length).decode())
+        return cmd, data
+
+    def pending(self):
+        """
+        :return: bool, True if bytes of a next frame were already received, in the buffer or decrypted
+                 by TLS, so waiting for the socket to become readable would miss them
+        """
+        if self.end > self.start:
+            return True
+        pending = getattr(self.my_socket, "pending", None)
+        return bool(pending and pending())
+
+    def receive(self, stream=False):
+        """
+        Receives a command and associated data, accepting both v1 and v2 frames.
+
+        In stream mode a binary last item is returned as an ItemStream, which must be
+        read before the next frame; whatever is left of it is skipped by the next call.
+        :param stream: bool, leave a final binary item on the socket instead of reading it
+        :return: tuple, (cmd: str, data: list) on success, or ("error", [error_message]) on failure
+        """
+        try:
+            if self.stream is not None:
+                self.stream.discard()
+                self.stream = None
+
+            version = 2 if self._peek(2) == FRAME_MAGIC else 1
+            if self.version is None:
+                self.version = version
+            elif version != self.version:
+                raise ValueError(f"v{version} frame on a v{self.version} connection")
+
+            if version == 2:
+                return self._receive_v2(stream)
+            return self._receive_v1(stream)
+
+        except socket.timeout:
+            print("socket timeout over in recv")
+            return "error", ["timeout"]
+
+        except ssl.SSLError as e:
+            print(f"SSL error during receive: {e}")
+            return "error", [f"ssl error: {e}"]
+
+        except Exception as e:
+            print("Error in protocol_receive:", e)
+            return "error", [str(e)]
+
+
+class ItemStream:
+    """
+    A binary item that is still on the socket, returned by FrameReader.receive(stream=True).
+    It is read once, in order, either as chunks or straight into a file or buffer,
+    so a large item never has to be held in memory as a whole.
+    """
+    def __init__(self, reader, length):
+        """
+        :param reader: FrameReader, the reader the item is read from
+        :param length: int, item length in bytes
+        """
+        self.reader = reader
+        self.length = length
+        self.remaining = length
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"<stream of {self.length} bytes>"
+
+    def readinto(self, buffer):
+        """
+        Reads the next part of the item into buffer.
+        :param buffer: writable bytes-like object
+        :return: int, number of bytes read, 0 once the item is fully read
+        """
+        view = memoryview(buffer).cast("B")
+        if not self.remaining or not len(view):
+            return 0
+        count = self.reader._readinto(view[:self.remaining])
+        self.remaining -= count
+        return count
+
+    def chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Iterates over the rest of the item.
+        :param chunk_size: int, maximum chunk size in bytes
+        :return: generator of bytes
+        """
+        chunk = bytearray(chunk_size)
+        while self.remaining:
+            count = self.readinto(chunk)
+            yield bytes(chunk[:count])
+
+    def write_to(self, file, chunk_size=STREAM_CHUNK_SIZE, progress=None):
+        """
+        Writes the rest of the item to a file as it arrives, through one reusable buffer.
+        :param file: binary file object opened for writing
+        :param chunk_size: int, buffer size in bytes
+        :param progress: callable, optional, called with the byte count of every chunk once it is
+                         flushed to the file, so other readers of the file can follow the download
+        :return: int, number of bytes written
+        """
+        chunk = bytearray(chunk_size)
+        view = memoryview(chunk)
+        written = 0
+        while self.remaining:
+            count = self.readinto(chunk)
+            file.write(view[:count])
+            written += count
+            if progress:
+                file.flush()
+                progress(count)
+        return written
+
+    def read_all(self):
+        """
+        Reads the rest of the item into memory.
+        :return: bytes
+        """
+        item = bytearray(self.remaining)
+        view = memoryview(item)
+        received = 0
+        while self.remaining:
+            received += self.readinto(view[received:])
+        return bytes(item)
+
+    def discard(self):
+        """
+        Skips the rest of the item so the next frame can be read.
+        :return: None
+        """
+        for _ in self.chunks():
+            pass
+
+
+async def async_protocol_send(writer, cmd, data, version=PROTOCOL_VERSION, request_id=0):
+    """
+    Sends a frame on an asyncio stream, the event loop counterpart of protocol_send.
+    :param writer: asyncio.StreamWriter, the stream to send the data through
+    :param cmd: str, a 3-character command indicating the request type
+    :param data: list, a list of strings or bytes objects to send
+    :param version: int, frame format to use (1 = ASCII lengths, 2 = binary header)
+    :param request_id: int, ID matching a reply to its request (v2 only, 0 = not pipelined)
+    :return: None
+    """
+    if version == 1:
+        segments = frame_segments_v1(cmd, data)
+    else:
+        segments = frame_segments_v2(cmd, data, request_id)
+    # writelines queues the whole frame at once, so frames of concurrent tasks never interleave
+    writer.writelines(segments)
+    await writer.drain()
+
+
+class AsyncFrameReader:
+    """
+    Parses protocol frames from an asyncio stream, the event loop counterpart of FrameReader.
+    asyncio.StreamReader already buffers the connection, so whole headers and bodies are
+    read with readexactly().
+    """
+    def __init__(self, stream_reader):
+        """
+        :param stream_reader: asyncio.StreamReader of the connection
+        """
+        self.stream_reader = stream_reader
+        self.version = None  # negotiated on the first frame
+        self.request_id = 0  # request ID of the last frame, 0 for v1 frames
+
+    async def _read_text(self, length):
+        """
+        Reads a v1 string item of length characters, decoding UTF-8 as it goes.
+        :param length: int, number of characters in the item
+        :return: str
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        item = decoder.decode(await self.stream_reader.readexactly(length))
+        while len(item) < length:
+            item += decoder.decode(await self.stream_reader.readexactly(length - len(item)))
+        return item
+
+    async def _receive_v1(self, first):
+        """
+        Parses the rest of a v1 frame.
+        :param first: bytes, the 3-byte command already read
+        :return: tuple, (cmd: str, data: list)
+        """
+        self.request_id = 0
+        num_of_items = int((await self.stream_reader.readexactly(1)).decode())
+        data = []
+        for i in range(num_of_items):
+            sign = (await self.stream_reader.readexactly(1)).decode()
+            i_length = int((await self.stream_reader.readuntil(b"!"))[:-1].decode())
+            if sign == 'b':
+                data.append(await self.stream_reader.readexactly(i_length))
+            elif sign == 's':
+                data.append(await self._read_text(i_length))
+        return first.decode(), data
+
+    async def _receive_v2(self, first):
+        """
+        Parses the rest of a v2 frame.
+        :param first: bytes, the first 3 header bytes already read
+        :return: tuple, (cmd: str, data: list)
+        """
+        header = first + await self.stream_reader.readexactly(HEADER.size - len(first))
+        cmd, num_of_items, self.request_id, body_length = parse_header(header)
+        body = await self.stream_reader.readexactly(body_length)
+        table_size = num_of_items * ITEM_ENTRY.size
+        return cmd, decode_items_v2(body[:table_size], memoryview(body)[table_size:])
+
+    async def receive(self):
+        """
+        Receives a command and associated data, accepting both v1 and v2 frames.
+        :return: tuple, (cmd: str, data: list) on success, or ("error", [error_message]) on failure
+        """
+        try:
+            first = await self.stream_reader.readexactly(3)
+            version = 2 if first[:2] == FRAME_MAGIC else 1
+            if self.version is None:
+                self.version = version
+            elif version != self.version:
+                raise ValueError(f"v{version} frame on a v{self.version} connection")
+
+            if version == 2:
+                return await self._receive_v2(first)
+            return await self._receive_v1(first)
+
+        except asyncio.IncompleteReadError:
+            return "error", ["Connection closed while receiving data"]
+
+        except asyncio.TimeoutError:
+            return "error", ["timeout"]
+
+        except ssl.SSLError as e:
+            return "error", [f"ssl error: {e}"]
+
+        except Exception as e:
+            return "error", [str(e)]
+
+
 def recv_all(sock, length):
     data = b''
     while len(data) < length: